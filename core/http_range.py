@@ -0,0 +1,52 @@
+"""Helpers for serving HTTP Range requests (206 Partial Content)"""
+import re
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested range lies outside the object"""
+
+
+def parse_range_header(header, size):
+    """
+    Return the (start, end) byte offsets, inclusive, for a Range header.
+    Malformed or multi-range headers return None so the caller can send the
+    whole object, which RFC 7233 allows.
+    """
+    match = RANGE_RE.match((header or '').strip())
+    if not match:
+        return None
+
+    first, last = match.groups()
+    if not first and not last:
+        return None
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise RangeNotSatisfiable(header)
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def iter_file_range(fileobj, start, end, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield bytes start..end (inclusive) from an open file, then close it"""
+    try:
+        fileobj.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            data = fileobj.read(min(chunk_size, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+    finally:
+        fileobj.close()
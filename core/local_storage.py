@@ -0,0 +1,49 @@
+import logging
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import FileSystemStorage
+from django.urls import reverse
+
+from .http_range import iter_file_range
+
+logger = logging.getLogger(__name__)
+
+SIGNED_UPLOAD_SALT = 'core.local_storage.signed_upload'
+
+
+class LocalStorage(FileSystemStorage):
+    """
+    FileSystemStorage with the same signed-upload hooks as SupabaseStorage,
+    so the direct-to-storage upload flow also works in development.
+    """
+
+    def create_signed_upload(self, name):
+        """Return where and how the browser should PUT the file for `name`"""
+        name = name.replace('\\', '/')
+        token = signing.dumps({'name': name}, salt=SIGNED_UPLOAD_SALT)
+        return {
+            'url': reverse('core:local_signed_upload', args=[token]),
+            'method': 'PUT',
+            'headers': {},
+            'path': name,
+        }
+
+    def resolve_signed_upload(self, token):
+        """Return the object name a signed upload token was issued for"""
+        data = signing.loads(
+            token,
+            salt=SIGNED_UPLOAD_SALT,
+            max_age=settings.DIRECT_UPLOAD_URL_EXPIRES_IN,
+        )
+        return data['name']
+
+    def stream_range(self, name, start, end):
+        """Iterate over bytes start..end (inclusive) of the file"""
+        return iter_file_range(self.open(name, 'rb'), start, end)
+
+    def delete_many(self, names):
+        """Same interface as SupabaseStorage.delete_many; the filesystem has no batch delete"""
+        names = [name for name in names if name]
+        for name in names:
+            self.delete(name)
+        return len(names)
@@ -0,0 +1,44 @@
+"""
+Redis leases for single-flight work across Celery workers.
+
+A lease is a Redis lock with a timeout, so a crashed worker can never hold
+it forever. Callers pair it with a database compare-and-set: the lease
+keeps duplicate runs cheap, and the database stays the source of truth
+when Redis is unavailable.
+"""
+import logging
+from contextlib import contextmanager
+
+import redis
+from redis.exceptions import LockError
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'slaq:lease'
+
+
+@contextmanager
+def lease(name, timeout):
+    """
+    Try to take the lease `name` for up to `timeout` seconds without waiting.
+    Yields True when held (or when Redis is down), False when another worker holds it.
+    """
+    lock = get_redis().lock(f'{KEY_PREFIX}:{name}', timeout=timeout)
+    try:
+        acquired = lock.acquire(blocking=False)
+    except redis.RedisError as e:
+        logger.warning(f"Lease {name} unavailable, relying on the database: {e}")
+        yield True
+        return
+
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                lock.release()
+            except (LockError, redis.RedisError) as e:
+                # Lease expired mid-run or Redis went away; it times out on its own
+                logger.warning(f"Could not release lease {name}: {e}")
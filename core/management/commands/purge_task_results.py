@@ -0,0 +1,51 @@
+# core/management/commands/purge_task_results.py
+"""
+Purge the django_celery_results table in chunks.
+
+After switching CELERY_RESULT_BACKEND away from django-db the old rows are
+dead weight. One big DELETE would lock the table and bloat WAL, so rows go
+in keyset-ordered chunks, each in its own short transaction.
+
+Usage:
+    python manage.py purge_task_results                    # everything
+    python manage.py purge_task_results --older-than-hours 24
+    python manage.py purge_task_results --batch-size 5000 --sleep 0.5
+"""
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django_celery_results.models import TaskResult
+
+
+class Command(BaseCommand):
+    help = "Delete stored Celery task results in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than-hours', type=int, default=0, help="Keep results newer than this")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Pause between chunks to spare the database")
+
+    def handle(self, *args, older_than_hours=0, batch_size=5000, sleep=0.0, **options):
+        results = TaskResult.objects.all()
+        if older_than_hours:
+            results = results.filter(date_done__lt=timezone.now() - timedelta(hours=older_than_hours))
+
+        started = time.monotonic()
+        deleted = 0
+        last_id = 0
+        while True:
+            ids = list(results.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                break
+            TaskResult.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            last_id = ids[-1]
+
+            elapsed = time.monotonic() - started
+            self.stdout.write(f"Deleted {deleted} task results ({deleted / elapsed:.0f} rows/s)")
+            if sleep:
+                time.sleep(sleep)
+
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} task results in {time.monotonic() - started:.1f}s"))
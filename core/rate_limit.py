@@ -0,0 +1,80 @@
+"""
+Redis-backed token buckets for per-user rate limiting.
+
+Each bucket refills continuously at `rate` tokens per second up to
+`capacity`. The refill-and-take step runs as one Lua script, so concurrent
+web workers can never both spend the last token. If Redis is unreachable
+the limiter fails open: losing the limiter must not take uploads down.
+"""
+import logging
+import math
+import time
+
+import redis
+from django.conf import settings
+
+from .redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'slaq:ratelimit'
+
+# KEYS[1] = bucket; ARGV = rate, capacity, now, requested
+# Returns {allowed, seconds until enough tokens as a string}
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local requested = tonumber(ARGV[4])
+
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local retry_after = 0
+if tokens >= requested then
+    tokens = tokens - requested
+    allowed = 1
+else
+    retry_after = (requested - tokens) / rate
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+_script = None
+
+
+class TokenBucket:
+    def __init__(self, name, rate, capacity):
+        self.name = name
+        self.rate = rate  # tokens per second
+        self.capacity = capacity
+
+    def take(self, key, tokens=1):
+        """Spend tokens from key's bucket; returns (allowed, retry_after_seconds)"""
+        global _script
+        try:
+            if _script is None:
+                _script = get_redis().register_script(TOKEN_BUCKET_SCRIPT)
+            allowed, retry_after = _script(
+                keys=[f'{KEY_PREFIX}:{self.name}:{key}'],
+                args=[self.rate, self.capacity, time.time(), tokens],
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Rate limiter unavailable, allowing {self.name}:{key}: {e}")
+            return True, 0
+        return bool(allowed), math.ceil(float(retry_after))
+
+
+def upload_bucket():
+    """Per-patient upload bucket: UPLOAD_RATE_LIMIT_PER_HOUR sustained, UPLOAD_RATE_LIMIT_BURST at once"""
+    return TokenBucket(
+        'upload',
+        rate=settings.UPLOAD_RATE_LIMIT_PER_HOUR / 3600.0,
+        capacity=settings.UPLOAD_RATE_LIMIT_BURST,
+    )
@@ -0,0 +1,13 @@
+"""Shared Redis connections for the rate limiter and broker metrics"""
+import redis
+from django.conf import settings
+
+_clients = {}
+
+
+def get_redis(url=None):
+    """Lazily created client per URL (REDIS_URL by default), with short timeouts"""
+    url = url or settings.REDIS_URL
+    if url not in _clients:
+        _clients[url] = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _clients[url]
@@ -0,0 +1,149 @@
+"""
+Chunked, resumable uploads against Supabase Storage's TUS endpoint.
+
+Memory stays bounded by one chunk: the file is streamed from the Django File
+in fixed-size pieces, each PATCHed at the server's current offset. A dropped
+connection only costs the chunk in flight - the offset is re-read with HEAD
+and the upload carries on from there.
+"""
+import base64
+import logging
+import time
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+TUS_VERSION = '1.0.0'
+
+
+class ResumableUploadError(Exception):
+    """Raised when a chunk still fails after all retries"""
+
+
+class ResumableUpload:
+    def __init__(self, endpoint, headers, chunk_size, max_retries=5, backoff_seconds=1.0, timeout=60):
+        self.endpoint = endpoint
+        self.headers = dict(headers, **{'Tus-Resumable': TUS_VERSION})
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def upload(self, bucket, name, content, size, content_type):
+        """Stream `content` to `bucket/name`, returning bytes sent and throughput"""
+        started = time.monotonic()
+        location = self._create(bucket, name, size, content_type)
+        offset = 0
+
+        for chunk in content.chunks(self.chunk_size):
+            offset = self._send_chunk(location, offset, chunk)
+
+        if offset != size:
+            raise ResumableUploadError(f"upload of {name} ended at offset {offset} of {size}")
+
+        elapsed = max(time.monotonic() - started, 1e-6)
+        stats = {
+            'bytes': size,
+            'seconds': round(elapsed, 3),
+            'mb_per_second': round(size / elapsed / (1024 * 1024), 3),
+        }
+        logger.info(f"resumable upload {name}: {size} bytes in {stats['seconds']}s ({stats['mb_per_second']} MB/s)")
+        return stats
+
+    def _create(self, bucket, name, size, content_type):
+        metadata = ','.join(
+            f"{key} {base64.b64encode(value.encode()).decode()}"
+            for key, value in (
+                ('bucketName', bucket),
+                ('objectName', name),
+                ('contentType', content_type),
+                ('cacheControl', '3600'),
+            )
+        )
+        headers = dict(self.headers, **{
+            'Upload-Length': str(size),
+            'Upload-Metadata': metadata,
+            'x-upsert': 'false',
+        })
+        response = self._with_retries(
+            lambda: self.session.post(self.endpoint, headers=headers, timeout=self.timeout),
+            f"create {name}",
+        )
+        return response.headers['Location']
+
+    def _send_chunk(self, location, offset, chunk):
+        """
+        PATCH one chunk, resuming from the server's offset after a failure.
+        A 204 that acknowledges only part of the chunk is followed by the
+        rest of it; a retry is only spent when no progress was made.
+        """
+        chunk_start = offset
+        chunk_end = chunk_start + len(chunk)
+        attempt = 0
+
+        while True:
+            try:
+                data = chunk[offset - chunk_start:]
+                headers = dict(self.headers, **{
+                    'Upload-Offset': str(offset),
+                    'Content-Type': 'application/offset+octet-stream',
+                })
+                response = self.session.patch(location, data=data, headers=headers, timeout=self.timeout)
+                if response.status_code == 204:
+                    acknowledged = int(response.headers.get('Upload-Offset', chunk_end))
+                    acknowledged = min(max(acknowledged, chunk_start), chunk_end)
+                    if acknowledged == chunk_end:
+                        return chunk_end
+                    if acknowledged > offset:
+                        offset = acknowledged
+                        continue
+                    logger.warning(f"chunk at offset {offset} was acknowledged without progress")
+                else:
+                    if response.status_code < 500 and response.status_code != 409:
+                        response.raise_for_status()
+                    logger.warning(f"chunk at offset {offset} rejected with {response.status_code}")
+            except requests.exceptions.HTTPError:
+                raise
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"chunk at offset {offset} failed: {e}")
+
+            if attempt == self.max_retries:
+                break
+            time.sleep(self.backoff_seconds * (2 ** attempt))
+            attempt += 1
+            offset = self._server_offset(location, chunk_start, chunk_end)
+            if offset == chunk_end:
+                return offset
+
+        raise ResumableUploadError(f"chunk at offset {chunk_start} failed after {self.max_retries} retries")
+
+    def _server_offset(self, location, chunk_start, chunk_end):
+        """Ask the server how much of the current chunk it actually received"""
+        try:
+            response = self.session.head(location, headers=self.headers, timeout=self.timeout)
+            response.raise_for_status()
+            offset = int(response.headers['Upload-Offset'])
+        except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+            logger.warning(f"could not read upload offset, resending chunk: {e}")
+            return chunk_start
+        return min(max(offset, chunk_start), chunk_end)
+
+    def _with_retries(self, send, description):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = send()
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    return response
+                logger.warning(f"{description} failed with {response.status_code}")
+            except requests.exceptions.HTTPError:
+                raise
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"{description} failed: {e}")
+
+            if attempt < self.max_retries:
+                time.sleep(self.backoff_seconds * (2 ** attempt))
+
+        raise ResumableUploadError(f"{description} failed after {self.max_retries} retries")
@@ -0,0 +1,155 @@
+"""
+Read-through disk cache for objects pulled from remote storage.
+
+Entries are keyed by object name plus ETag, so a replaced object is never
+served stale. Files are written to a temp file and renamed into place, and
+the least recently used entries are evicted once the byte budget is exceeded.
+The directory is only scanned when the bytes written since the last scan
+could have pushed it over budget, not on every write.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+STATS_KEYS = ('hits', 'misses', 'bytes_saved', 'bytes_fetched')
+STATS_PREFIX = 'storage_cache'
+
+_storage_cache = None
+
+
+class DiskCache:
+    # Share of the budget this process may write between directory scans, so
+    # writes from other processes sharing the directory are noticed in time
+    RESCAN_FRACTION = 0.1
+
+    def __init__(self, root, max_bytes):
+        self.root = str(root)
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+        self.scanned_bytes = None  # size on disk at the last scan
+        self.written_bytes = 0  # written by this process since then
+
+    def path_for(self, name, etag):
+        key = hashlib.sha256(f"{name}\0{etag}".encode()).hexdigest()
+        return os.path.join(self.root, key[:2], key)
+
+    def open(self, name, etag):
+        """
+        Return the cached file opened for reading, or None on a miss. An
+        entry evicted by another process in the meantime is just a miss.
+        """
+        path = self.path_for(name, etag)
+        try:
+            os.utime(path)  # bump recency for LRU
+            return open(path, 'rb')
+        except FileNotFoundError:
+            return None
+
+    def put(self, name, etag, write):
+        """
+        Fill the entry by calling write(fileobj) and return it opened for
+        reading. Readers never see a partially written file, and the entry is
+        opened before eviction runs, so it can't disappear under the caller.
+        """
+        path = self.path_for(name, etag)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+                size = f.tell()
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        entry = open(path, 'rb')
+        self.written_bytes += size
+        if self._may_be_over_budget():
+            self.evict()
+        return entry
+
+    def _may_be_over_budget(self):
+        """True when a scan is due: never scanned, possibly over budget, or drifted"""
+        if self.scanned_bytes is None:
+            return True
+        return (
+            self.scanned_bytes + self.written_bytes > self.max_bytes
+            or self.written_bytes > self.max_bytes * self.RESCAN_FRACTION
+        )
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its budget"""
+        entries = []
+        total = 0
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes * 0.9:
+                    break
+            logger.info(f"storage cache evicted down to {total} bytes")
+
+        self.scanned_bytes = total
+        self.written_bytes = 0
+
+
+def get_storage_cache():
+    """Process-wide DiskCache, or None when caching is disabled"""
+    global _storage_cache
+    if not settings.STORAGE_CACHE_MAX_BYTES:
+        return None
+    if _storage_cache is None:
+        _storage_cache = DiskCache(settings.STORAGE_CACHE_DIR, settings.STORAGE_CACHE_MAX_BYTES)
+    return _storage_cache
+
+
+def _incr(stat, amount=1):
+    key = f"{STATS_PREFIX}:{stat}"
+    try:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key, amount)
+    except Exception as e:
+        logger.debug(f"could not record storage cache stat {stat}: {e}")
+
+
+def record_hit(size):
+    _incr('hits')
+    _incr('bytes_saved', size)
+
+
+def record_miss(size):
+    _incr('misses')
+    _incr('bytes_fetched', size)
+
+
+def get_stats():
+    """Hit rate and byte counters shared by every node using this cache backend"""
+    values = cache.get_many([f"{STATS_PREFIX}:{stat}" for stat in STATS_KEYS])
+    stats = {stat: values.get(f"{STATS_PREFIX}:{stat}", 0) for stat in STATS_KEYS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+    return stats
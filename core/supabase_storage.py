@@ -1,13 +1,28 @@
 import os
+import hashlib
 import logging
+import mimetypes
+import tempfile
+from urllib.parse import quote
+
+import requests
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files import File
 from django.core.files.storage import Storage
 from django.conf import settings
 
 from supabase import create_client
+from .http_range import STREAM_CHUNK_SIZE, iter_file_range
+from .resumable_upload import ResumableUpload
+from .storage_cache import get_storage_cache, record_hit as storage_record_hit, record_miss as storage_record_miss
 from .supabase_config import get_supabase_config
 
 logger = logging.getLogger(__name__)
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+METADATA_CACHE_PREFIX = 'supabase_meta'
+
 supabase_initialized = False
 supabase_client = None
 
@@ -37,53 +52,237 @@ class SupabaseStorage(Storage):
         try:
             # Normalize path separators to forward slashes for Supabase
             name = name.replace('\\', '/')
+            content_type = (
+                getattr(content, "content_type", None)
+                or mimetypes.guess_type(name)[0]
+                or "application/octet-stream"
+            )
+
+            # Anything bigger than one chunk is streamed with resumable uploads,
+            # so memory stays bounded and a dropped connection doesn't restart at zero
+            if content.size > settings.SUPABASE_UPLOAD_CHUNK_SIZE:
+                self._resumable_upload().upload(
+                    settings.SUPABASE_BUCKET_NAME, name, content, content.size, content_type
+                )
+                cache.delete(self._metadata_cache_key(name))
+                return name
 
+            content.seek(0)
             content_bytes = content.read()
             content.seek(0)
 
             self.bucket.from_(settings.SUPABASE_BUCKET_NAME).upload(
                 path=name,
                 file=content_bytes,
-                file_options={
-                    "content-type": content.content_type if hasattr(content, "content_type") else "application/octet-stream"
-                }
+                file_options={"content-type": content_type}
             )
+            cache.delete(self._metadata_cache_key(name))
             return name
         except Exception as e:
             logger.error(f"upload error {name}: {e}")
             raise
 
+    def _auth_headers(self):
+        key = get_supabase_config()['key']
+        return {'apikey': key, 'authorization': f'Bearer {key}'}
+
+    def _resumable_upload(self):
+        return ResumableUpload(
+            endpoint=f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1/upload/resumable",
+            headers=self._auth_headers(),
+            chunk_size=settings.SUPABASE_UPLOAD_CHUNK_SIZE,
+            max_retries=settings.SUPABASE_UPLOAD_MAX_RETRIES,
+        )
+
     def _open(self, name, mode="rb"):
         try:
             # Normalize path separators
             name = name.replace('\\', '/')
-            data = self.bucket.from_(settings.SUPABASE_BUCKET_NAME).download(name)
-            from io import BytesIO
-            return BytesIO(data)
+            storage_cache = get_storage_cache()
+            if storage_cache is None:
+                tmp = tempfile.TemporaryFile()
+                self._download_to(name, tmp)
+                tmp.seek(0)
+                return File(tmp, name=name)
+
+            # Read-through: the ETag makes sure a replaced object is never served stale
+            head = self._metadata(name)
+            if head is None:
+                raise FileNotFoundError(name)
+            cached = storage_cache.open(name, head['etag'])
+            if cached:
+                storage_record_hit(head['size'])
+            else:
+                cached = storage_cache.put(name, head['etag'], lambda f: self._download_to(name, f))
+                storage_record_miss(head['size'])
+            return File(cached, name=name)
         except Exception as e:
             logger.error(f"download error {name}: {e}")
             raise
 
+    def _object_url(self, name):
+        return (
+            f"{settings.SUPABASE_URL.rstrip('/')}/storage/v1/object/authenticated/"
+            f"{settings.SUPABASE_BUCKET_NAME}/{quote(name)}"
+        )
+
+    def _head(self, name):
+        """Object metadata (etag, size, content type) or None if it doesn't exist"""
+        response = requests.head(self._object_url(name), headers=self._auth_headers(), timeout=30)
+        if response.status_code in (400, 404):
+            return None
+        response.raise_for_status()
+        return {
+            'etag': response.headers.get('ETag', '').strip('"'),
+            'size': int(response.headers.get('Content-Length') or 0),
+            'content_type': response.headers.get('Content-Type', 'application/octet-stream'),
+        }
+
+    def _metadata_cache_key(self, name):
+        digest = hashlib.sha1(f"{settings.SUPABASE_BUCKET_NAME}/{name}".encode()).hexdigest()
+        return f"{METADATA_CACHE_PREFIX}:{digest}"
+
+    def _metadata(self, name):
+        """
+        _head() behind a short-TTL cache. Misses are cached too (as an empty
+        dict), so repeated exists() checks for a missing object stay cheap.
+        """
+        key = self._metadata_cache_key(name)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached or None
+
+        head = self._head(name)
+        if head is None:
+            cache.set(key, {}, settings.SUPABASE_METADATA_NEGATIVE_TTL)
+        else:
+            cache.set(key, head, settings.SUPABASE_METADATA_CACHE_TTL)
+        return head
+
+    def stream_range(self, name, start, end):
+        """
+        Iterate over bytes start..end (inclusive) of the object, from the local
+        disk cache when this node has it, otherwise with a ranged GET.
+        """
+        name = name.replace('\\', '/')
+        storage_cache = get_storage_cache()
+        if storage_cache is not None:
+            head = self._metadata(name)
+            cached = head and storage_cache.open(name, head['etag'])
+            if cached:
+                storage_record_hit(end - start + 1)
+                return iter_file_range(cached, start, end)
+        return self._iter_remote_range(name, start, end)
+
+    def _iter_remote_range(self, name, start, end):
+        headers = dict(self._auth_headers(), Range=f"bytes={start}-{end}")
+        with requests.get(self._object_url(name), headers=headers, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            # A 200 means the range was ignored: skip to start and stop at end ourselves
+            skip = start if response.status_code == 200 else 0
+            remaining = end - start + 1
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                if skip:
+                    dropped = min(skip, len(chunk))
+                    chunk = chunk[dropped:]
+                    skip -= dropped
+                chunk = chunk[:remaining]
+                if chunk:
+                    remaining -= len(chunk)
+                    yield chunk
+                if remaining <= 0:
+                    break
+
+    def _download_to(self, name, fileobj):
+        """Stream the object into fileobj without holding it in memory"""
+        with requests.get(self._object_url(name), headers=self._auth_headers(), stream=True, timeout=60) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                fileobj.write(chunk)
+
     def delete(self, name):
         try:
             # Normalize path separators
             name = name.replace('\\', '/')
             self.bucket.from_(settings.SUPABASE_BUCKET_NAME).remove([name])
+            cache.set(self._metadata_cache_key(name), {}, settings.SUPABASE_METADATA_NEGATIVE_TTL)
         except Exception as e:
             logger.error(f"delete error {name}: {e}")
             raise
 
+    def delete_many(self, names):
+        """Remove many objects with one remove() call per STORAGE_DELETE_BATCH_SIZE paths"""
+        names = [name.replace('\\', '/') for name in names if name]
+        batch_size = settings.STORAGE_DELETE_BATCH_SIZE
+        for i in range(0, len(names), batch_size):
+            batch = names[i:i + batch_size]
+            try:
+                self.bucket.from_(settings.SUPABASE_BUCKET_NAME).remove(batch)
+            except Exception as e:
+                logger.error(f"bulk delete error ({len(batch)} objects from {batch[0]}): {e}")
+                raise
+            cache.set_many(
+                {self._metadata_cache_key(name): {} for name in batch},
+                settings.SUPABASE_METADATA_NEGATIVE_TTL,
+            )
+        return len(names)
+
     def exists(self, name):
         try:
             # Normalize path separators
             name = name.replace('\\', '/')
-            folder = os.path.dirname(name) or ""
-            base = os.path.basename(name)
-            items = self.bucket.from_(settings.SUPABASE_BUCKET_NAME).list(path=folder)
-            return any(i["name"] == base for i in items)
-        except:
+            return self._metadata(name) is not None
+        except Exception:
             return False
 
+    def get_available_name(self, name, max_length=None):
+        """
+        Make the name unique with a random suffix instead of probing the bucket
+        with exists() until a free name turns up.
+        """
+        name = name.replace('\\', '/')
+        dir_name, file_name = os.path.split(name)
+        file_root, file_ext = os.path.splitext(file_name)
+        name = os.path.join(dir_name, self.get_alternative_name(file_root, file_ext))
+
+        if max_length is not None and len(name) > max_length:
+            truncation = len(name) - max_length
+            file_root = file_root[:-truncation]
+            if not file_root:
+                raise SuspiciousFileOperation(
+                    f'Storage can not find an available filename for "{name}". '
+                    'Please make sure that the corresponding file field '
+                    'allows sufficient "max_length".'
+                )
+            name = os.path.join(dir_name, self.get_alternative_name(file_root, file_ext))
+        return name
+
+    def create_signed_upload(self, name):
+        """Return where and how the browser should PUT the file for `name`"""
+        try:
+            name = name.replace('\\', '/')
+            signed = self.bucket.from_(settings.SUPABASE_BUCKET_NAME).create_signed_upload_url(name)
+            return {
+                'url': signed['signed_url'],
+                'method': 'PUT',
+                'headers': {'x-upsert': 'false'},
+                'path': name,
+            }
+        except Exception as e:
+            logger.error(f"signed upload url error {name}: {e}")
+            raise
+
+    def size(self, name):
+        try:
+            name = name.replace('\\', '/')
+            head = self._metadata(name)
+            if head is None:
+                raise FileNotFoundError(name)
+            return head['size']
+        except Exception as e:
+            logger.error(f"size error {name}: {e}")
+            raise
+
     def url(self, name):
         try:
             # Normalize path separators
@@ -14,4 +14,10 @@ urlpatterns = [
     # Dashboard & Profile
     path('dashboard/', views.dashboard, name='dashboard'),
     path('profile/', views.profile, name='profile'),
+
+    # Operational metrics (METRICS_TOKEN bearer token or staff session)
+    path('metrics/', views.metrics, name='metrics'),
+
+    # Development stand-in for signed storage uploads
+    path('storage/upload/<str:token>/', views.local_signed_upload, name='local_signed_upload'),
 ]
@@ -2,8 +2,21 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login
 from django.contrib import messages
+from django.conf import settings
+from django.core import signing
+from django.core.files import File
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.csrf import csrf_exempt
 from .forms import PatientRegistrationForm
-from diagnosis.models import AudioRecording, AnalysisResult
+from .local_storage import LocalStorage
+from . import storage_cache
+from diagnosis.models import AudioRecording, AnalysisResult, get_audio_storage
+from diagnosis.queues import get_backlog_stats
+
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 def home(request):
@@ -100,3 +113,78 @@ def profile(request):
     }
     
     return render(request, 'core/profile.html', context)
+
+
+@csrf_exempt
+def local_signed_upload(request, token):
+    """
+    Development stand-in for a storage bucket's signed upload URL.
+    The signed token is the credential, just like the bucket's own URLs.
+    """
+    if request.method != 'PUT':
+        return JsonResponse({'error': 'PUT method required'}, status=405)
+
+    storage = get_audio_storage()
+    if not isinstance(storage, LocalStorage):
+        return JsonResponse({'error': 'Not found'}, status=404)
+
+    try:
+        name = storage.resolve_signed_upload(token)
+    except signing.BadSignature:
+        return JsonResponse({'error': 'Upload URL is invalid or expired'}, status=403)
+
+    content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if content_length <= 0:
+        return JsonResponse({'error': 'Empty upload'}, status=400)
+    if content_length > settings.MAX_UPLOAD_SIZE:
+        return JsonResponse({'error': 'File too large'}, status=413)
+
+    if storage.exists(name):
+        return JsonResponse({'error': 'Object already exists'}, status=409)
+
+    # Stream the body to disk; File.chunks() reads from the request in pieces
+    saved_name = storage._save(name, File(request, name=name))
+    logger.info(f"Local signed upload stored {saved_name} ({content_length} bytes)")
+    return JsonResponse({'path': saved_name}, status=200)
+
+
+def _metrics_authorized(request):
+    """METRICS_TOKEN as a bearer token (autoscalers, scrapers), or a staff session"""
+    token = settings.METRICS_TOKEN
+    if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    return request.user.is_active and request.user.is_staff
+
+
+def _prometheus_lines(prefix, stats):
+    """Prometheus text lines for a flat dict; dict values become one labelled series per queue"""
+    for name, value in stats.items():
+        if isinstance(value, dict):
+            for queue, sample in value.items():
+                if sample is not None:
+                    yield f'{prefix}_{name}{{queue="{queue}"}} {float(sample)}'
+        elif isinstance(value, (bool, int, float)):
+            yield f'{prefix}_{name} {float(value)}'
+
+
+def metrics(request):
+    """
+    Operational metrics for dashboards and autoscalers, as JSON or, with
+    ?format=prometheus, Prometheus text. Never redirects to a login page.
+    """
+    if not _metrics_authorized(request):
+        response = JsonResponse({'error': 'Unauthorized'}, status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+
+    stats = {
+        'storage_cache': storage_cache.get_stats(),
+        'analysis': get_backlog_stats(),
+    }
+    if request.GET.get('format') == 'prometheus':
+        lines = [
+            *_prometheus_lines('slaq_storage_cache', stats['storage_cache']),
+            *_prometheus_lines('slaq_analysis', stats['analysis']),
+        ]
+        return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
+    return JsonResponse(stats)
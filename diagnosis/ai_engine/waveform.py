@@ -0,0 +1,94 @@
+# diagnosis/ai_engine/waveform.py
+"""
+Compact visual summaries of a recording: multi-resolution waveform peaks and
+a small spectrogram image, so pages can draw the stutter timeline from a few
+KB instead of downloading and decoding the whole file in the browser.
+"""
+import base64
+import logging
+import struct
+import zlib
+
+import librosa
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+PEAK_RESOLUTIONS = (256, 1024, 4096)
+PEAK_SAMPLE_RATE = 8000
+SPECTROGRAM_WIDTH = 512
+SPECTROGRAM_MELS = 64
+
+
+def compute_peaks(samples, buckets):
+    """
+    Min/max per bucket, quantized to int8 and interleaved as
+    [min0, max0, min1, max1, ...], then base64 encoded.
+    """
+    buckets = max(1, min(buckets, len(samples)))
+    bucket_size = int(np.ceil(len(samples) / buckets))
+    padded = np.zeros(bucket_size * buckets, dtype=np.float32)
+    padded[:len(samples)] = samples
+    frames = padded.reshape(buckets, bucket_size)
+
+    peaks = np.empty((buckets, 2), dtype=np.float32)
+    peaks[:, 0] = frames.min(axis=1)
+    peaks[:, 1] = frames.max(axis=1)
+
+    scale = float(np.abs(peaks).max()) or 1.0
+    quantized = np.clip(np.round(peaks / scale * 127), -127, 127).astype(np.int8)
+    return base64.b64encode(quantized.tobytes()).decode('ascii')
+
+
+def compute_spectrogram(samples, sample_rate, width=SPECTROGRAM_WIDTH, n_mels=SPECTROGRAM_MELS):
+    """Mel spectrogram squeezed to `width` columns as a uint8 image (low frequencies at the bottom)"""
+    hop_length = max(64, len(samples) // (width * 2))
+    mel = librosa.feature.melspectrogram(
+        y=samples, sr=sample_rate, n_mels=n_mels, hop_length=hop_length, n_fft=max(256, hop_length * 2)
+    )
+    db = librosa.power_to_db(mel, ref=np.max)
+
+    # Average adjacent frames down to the target width
+    columns = min(width, db.shape[1])
+    frames_per_column = db.shape[1] // columns
+    db = db[:, :columns * frames_per_column].reshape(n_mels, columns, frames_per_column).mean(axis=2)
+
+    low, high = db.min(), db.max()
+    normalized = (db - low) / ((high - low) or 1.0)
+    return np.flipud((normalized * 255).astype(np.uint8))
+
+
+def encode_png(image):
+    """Encode a 2D uint8 array as a grayscale PNG"""
+    height, width = image.shape
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), image]).tobytes()  # filter byte 0 per row
+
+    def chunk(tag, data):
+        body = tag + data
+        return struct.pack('>I', len(data)) + body + struct.pack('>I', zlib.crc32(body) & 0xFFFFFFFF)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', header)
+        + chunk(b'IDAT', zlib.compress(raw, 9))
+        + chunk(b'IEND', b'')
+    )
+
+
+def build_visuals(audio_path):
+    """
+    Returns:
+        (peaks dict for AudioRecording.waveform_peaks, spectrogram PNG bytes)
+    """
+    samples, sample_rate = librosa.load(audio_path, sr=PEAK_SAMPLE_RATE, mono=True)
+    if samples.size == 0:
+        raise ValueError(f"No audio samples in {audio_path}")
+
+    peaks = {
+        'duration': round(len(samples) / sample_rate, 3),
+        'resolutions': {str(n): compute_peaks(samples, n) for n in PEAK_RESOLUTIONS},
+    }
+    spectrogram = encode_png(compute_spectrogram(samples, sample_rate))
+    logger.info(f"📈 Built waveform peaks and {len(spectrogram)} byte spectrogram for {audio_path}")
+    return peaks, spectrogram
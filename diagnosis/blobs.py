@@ -0,0 +1,159 @@
+# diagnosis/blobs.py
+"""
+Content-addressed, reference-counted audio storage.
+
+Identical uploads share one AudioBlob (keyed by SHA-256) and one stored
+object. Every AudioRecording pointing at a blob holds one reference; the
+object is only removed from storage when the last reference is released.
+"""
+import hashlib
+import logging
+import os
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+
+from .models import AudioBlob, AudioRecording
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_blob_storage():
+    return AudioRecording._meta.get_field('audio_file').storage
+
+
+def blob_path(digest, ext):
+    return f'recordings/blobs/{digest[:2]}/{digest}{ext.lower()}'
+
+
+def sha256_of(content):
+    """Hash a Django File in chunks, leaving it rewound for the next reader"""
+    digest = hashlib.sha256()
+    for chunk in content.chunks(HASH_CHUNK_SIZE):
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def copy_and_hash(field_file, fileobj):
+    """Copy a stored file into fileobj, hashing it on the way; returns (sha256, size)"""
+    digest = hashlib.sha256()
+    size = 0
+    with field_file.open('rb') as source:
+        for chunk in source.chunks():
+            fileobj.write(chunk)
+            digest.update(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def _add_reference(blob):
+    AudioBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+
+def acquire_upload(content):
+    """
+    Return the blob for an uploaded file, holding one new reference.
+    Bytes are only transferred to storage when the content is new.
+    Call inside transaction.atomic() together with creating the recording.
+    """
+    digest = sha256_of(content)
+    blob = AudioBlob.objects.select_for_update().filter(sha256=digest).first()
+    if blob is not None:
+        logger.info(f"♻️ Duplicate upload {digest[:12]}, reusing {blob.path}")
+        _add_reference(blob)
+        return blob
+
+    storage = get_blob_storage()
+    ext = os.path.splitext(content.name or '')[1]
+    name = storage.save(blob_path(digest, ext), content)
+    blob, created = AudioBlob.objects.get_or_create(
+        sha256=digest,
+        defaults={'path': name, 'size_bytes': content.size},
+    )
+    if not created:
+        # Lost a race with an identical upload; keep theirs
+        transaction.on_commit(lambda: storage.delete(name))
+    _add_reference(blob)
+    return blob
+
+
+def acquire_existing(blob_id):
+    """Take one more reference on a blob that is known to exist; call inside transaction.atomic()"""
+    blob = AudioBlob.objects.select_for_update().get(pk=blob_id)
+    _add_reference(blob)
+    return blob
+
+
+def adopt_recording(recording, digest, size):
+    """
+    Attach an already stored recording (e.g. a direct upload) to the blob for
+    its content. If the content is known, the fresh copy is deleted and the
+    recording points at the shared object instead.
+    """
+    storage = get_blob_storage()
+    duplicate_path = None
+    with transaction.atomic():
+        # get_or_create, not a locked lookup: two identical direct uploads
+        # adopted at once must both end up on one blob, not an IntegrityError
+        blob, _ = AudioBlob.objects.get_or_create(
+            sha256=digest,
+            defaults={'path': recording.audio_file.name, 'size_bytes': size},
+        )
+        _add_reference(blob)
+        if blob.path != recording.audio_file.name:
+            duplicate_path = recording.audio_file.name
+
+        AudioRecording.objects.filter(pk=recording.pk).update(blob=blob, audio_file=blob.path)
+        if duplicate_path:
+            transaction.on_commit(lambda: storage.delete(duplicate_path))
+
+    recording.blob = blob
+    recording.audio_file.name = blob.path
+    if duplicate_path:
+        logger.info(f"♻️ Recording {recording.id} deduplicated onto {blob.path}")
+    return blob
+
+
+def release_blob(blob_id):
+    """Drop one reference; the stored object goes with the last one"""
+    storage = get_blob_storage()
+    with transaction.atomic():
+        blob = AudioBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            AudioBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            return
+
+        paths = [p for p in (blob.path, blob.original_path) if p]
+        blob.delete()
+        transaction.on_commit(lambda: storage.delete_many(paths))
+    logger.info(f"🗑️ Blob {blob_id} released its last reference")
+
+
+def release_blobs(ref_counts):
+    """
+    Drop references in bulk, given {blob_id: references}. Returns the storage
+    paths of blobs that lost their last reference; the caller deletes them
+    once the transaction has committed. Call inside transaction.atomic().
+    """
+    by_amount = defaultdict(list)
+    released = []
+    paths = []
+    for blob in AudioBlob.objects.select_for_update().filter(pk__in=list(ref_counts)):
+        amount = ref_counts[blob.pk]
+        if blob.ref_count > amount:
+            by_amount[amount].append(blob.pk)
+        else:
+            released.append(blob.pk)
+            paths += [p for p in (blob.path, blob.original_path) if p]
+
+    for amount, blob_ids in by_amount.items():
+        AudioBlob.objects.filter(pk__in=blob_ids).update(ref_count=F('ref_count') - amount)
+    if released:
+        AudioBlob.objects.filter(pk__in=released).delete()
+    return paths
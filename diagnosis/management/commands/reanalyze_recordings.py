@@ -0,0 +1,156 @@
+# diagnosis/management/commands/reanalyze_recordings.py
+"""
+Re-run analysis over the recording history after a model upgrade.
+
+Completed recordings without a result from the given model version are
+walked in id order (keyset, never OFFSET) and handed to the batch queue in
+chunks, with at most --concurrency chunks in flight. Submission pauses while
+the interactive queues are congested, so patients waiting on a fresh upload
+are never stuck behind a backfill.
+
+Progress is checkpointed to a JSON file after every finished chunk; an
+interrupted run picks up where it stopped, and a run that reaches the end
+removes it. Results from earlier versions are kept. Recordings that fail
+keep their current result, so the next full run picks them up again.
+The run stops if the batch workers' detector isn't --model-version.
+
+Daily progress is adjusted for every result that becomes current, so run
+`manage.py rebuild_progress` once before re-analysing recordings completed
+before progress tracking existed.
+
+With --shadow the new results are stored without becoming current, ready
+for AnalysisResult.compare_versions() before switching over.
+
+Usage:
+    python manage.py reanalyze_recordings --model-version v2
+    python manage.py reanalyze_recordings --model-version v2 --chunk-size 50 --concurrency 4
+    python manage.py reanalyze_recordings --model-version v2 --shadow    # store for A/B only
+    python manage.py reanalyze_recordings --model-version v2 --restart   # ignore the checkpoint
+    python manage.py reanalyze_recordings --model-version v2 --dry-run
+"""
+import json
+import os
+import time
+from collections import deque
+
+from celery.exceptions import TimeoutError
+from django.core.management.base import BaseCommand, CommandError
+
+from diagnosis.models import AudioRecording
+from diagnosis.queues import PRIORITY_BATCH, is_congested, queue_depths
+from diagnosis.tasks import reanalyze_recordings
+
+
+class Command(BaseCommand):
+    help = "Re-analyse completed recordings with a new model version on the batch queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model-version', required=True, help="Recordings with a result from this version are skipped")
+        parser.add_argument('--chunk-size', type=int, default=20, help="Recordings per batch task")
+        parser.add_argument('--concurrency', type=int, default=4, help="Batch tasks in flight at once")
+        parser.add_argument('--checkpoint', default='reanalysis_checkpoint.json')
+        parser.add_argument('--shadow', action='store_true', help="Store the new results without making them current")
+        parser.add_argument('--restart', action='store_true', help="Start from the beginning, ignoring the checkpoint")
+        parser.add_argument('--congestion-pause', type=float, default=30.0, help="Seconds to wait while interactive queues are congested")
+        parser.add_argument('--dry-run', action='store_true', help="Count what would be re-analysed")
+
+    def handle(self, *args, model_version, chunk_size=20, concurrency=4, checkpoint='reanalysis_checkpoint.json',
+               shadow=False, restart=False, congestion_pause=30.0, dry_run=False, **options):
+        recordings = (
+            AudioRecording.objects
+            .filter(status='completed')
+            .exclude(analyses__model_version=model_version)
+        )
+
+        state = self._load_checkpoint(checkpoint, model_version) if not restart else None
+        state = state or {'model_version': model_version, 'last_id': 0, 'done': 0, 'failed': []}
+        remaining = recordings.filter(id__gt=state['last_id']).count()
+        if dry_run:
+            self.stdout.write(f"{remaining} recordings would be re-analysed with {model_version}")
+            return
+        if state['last_id']:
+            self.stdout.write(f"Resuming after recording {state['last_id']} ({state['done']} already done)")
+
+        started = time.monotonic()
+        processed = 0
+        in_flight = deque()  # (chunk ids, AsyncResult), oldest first
+        next_id = state['last_id']
+        exhausted = False
+
+        while in_flight or not exhausted:
+            # Top up to the concurrency limit, unless patients are waiting
+            while not exhausted and len(in_flight) < concurrency:
+                if is_congested(queue_depths()):
+                    if not in_flight:
+                        self.stdout.write(f"Interactive queues congested, pausing {congestion_pause:.0f}s")
+                        time.sleep(congestion_pause)
+                        continue
+                    break
+                ids = list(recordings.filter(id__gt=next_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+                if not ids:
+                    exhausted = True
+                    break
+                next_id = ids[-1]
+                in_flight.append((ids, reanalyze_recordings.apply_async(
+                    args=[ids], kwargs={'make_current': not shadow, 'model_version': model_version}, priority=PRIORITY_BATCH
+                )))
+
+            if not in_flight:
+                break
+
+            # The checkpoint only advances past chunks that have all finished
+            ids, result = in_flight[0]
+            try:
+                outcome = result.get(timeout=5)
+            except TimeoutError:
+                continue
+            except Exception as e:
+                self.stderr.write(f"Chunk ending at recording {ids[-1]} failed: {e}")
+                outcome = {'done': 0, 'failed': ids}
+            in_flight.popleft()
+            if outcome.get('version_mismatch'):
+                # Nothing would ever converge; stop with the checkpoint where it is
+                raise CommandError(
+                    f"Workers run model {outcome['version_mismatch']}, not {model_version}; "
+                    f"deploy {model_version} to the batch workers and run again"
+                )
+
+            state['last_id'] = ids[-1]
+            state['done'] += outcome['done']
+            state['failed'] += outcome['failed']
+            processed += len(ids)
+            self._save_checkpoint(checkpoint, state)
+            self._report(state, processed, remaining, started)
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Re-analysed {state['done']} recordings with {model_version} in {time.monotonic() - started:.1f}s"
+            + (f", {len(state['failed'])} failed (run again to retry them)" if state['failed'] else "")
+        ))
+
+    def _report(self, state, finished, remaining, started):
+        elapsed = time.monotonic() - started
+        rate = finished / elapsed if elapsed else 0.0
+        eta = max(remaining - finished, 0) / rate if rate else None
+        self.stdout.write(
+            f"{state['done']} re-analysed, {len(state['failed'])} failed, up to recording {state['last_id']} "
+            f"({rate:.2f} recordings/s, ETA {f'{eta / 60:.0f}m' if eta is not None else 'unknown'})"
+        )
+
+    def _load_checkpoint(self, path, model_version):
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            state = json.load(f)
+        if state.get('model_version') != model_version:
+            self.stdout.write(f"Checkpoint {path} is for {state.get('model_version')}, starting over")
+            return None
+        return state
+
+    def _save_checkpoint(self, path, state):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
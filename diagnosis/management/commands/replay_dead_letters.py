@@ -0,0 +1,54 @@
+# diagnosis/management/commands/replay_dead_letters.py
+"""
+Replay analysis jobs parked in the dead-letter table.
+
+Usage:
+    python manage.py replay_dead_letters              # everything not yet replayed
+    python manage.py replay_dead_letters --id 12 --id 15
+    python manage.py replay_dead_letters --reason exhausted --limit 100
+    python manage.py replay_dead_letters --dry-run
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from diagnosis.models import AudioRecording, DeadLetter
+from diagnosis.tasks import enqueue_analysis
+
+
+class Command(BaseCommand):
+    help = "Requeue dead-lettered analysis jobs on the batch queue"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--id', type=int, action='append', dest='ids', help="Dead letter id (repeatable)")
+        parser.add_argument('--reason', choices=[c for c, _ in DeadLetter.REASON_CHOICES])
+        parser.add_argument('--limit', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help="List what would be replayed")
+
+    def handle(self, *args, ids=None, reason=None, limit=1000, dry_run=False, **options):
+        letters = DeadLetter.objects.filter(replayed_at__isnull=True).select_related('recording')
+        if ids:
+            letters = letters.filter(id__in=ids)
+        if reason:
+            letters = letters.filter(reason=reason)
+        letters = list(letters.order_by('failed_at')[:limit])
+
+        if dry_run:
+            for letter in letters:
+                self.stdout.write(f"{letter.id}: recording {letter.recording_id} - {letter.exception_type}: {letter.error_message[:80]}")
+            self.stdout.write(f"{len(letters)} dead letters would be replayed")
+            return
+
+        replayed = 0
+        for letter in letters:
+            with transaction.atomic():
+                # Only recordings that are still failed; a later success wins
+                reset = AudioRecording.objects.filter(pk=letter.recording_id, status='failed').update(
+                    status='pending', error_message='', queued_at=None, heartbeat_at=None
+                )
+                DeadLetter.objects.filter(pk=letter.pk).update(replayed_at=timezone.now())
+            if reset:
+                enqueue_analysis(letter.recording, interactive=False)
+                replayed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Replayed {replayed} of {len(letters)} dead letters"))
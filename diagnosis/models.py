@@ -1,18 +1,29 @@
 # diagnosis/models.py
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F, Q
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from core.models import Patient
-from django.core.files.storage import FileSystemStorage
+from core.local_storage import LocalStorage
 from core.supabase_storage import SupabaseStorage
 from django.conf import settings
 import os
 
 
+def build_audio_path(patient_id, filename):
+    """Build storage path: recordings/patient_id/year/month/filename"""
+    now = timezone.now()
+    return f'recordings/{patient_id}/{now.year}/{now.month}/{filename}'
+
+
 def audio_upload_path(instance, filename):
     """Generate upload path: recordings/patient_id/year/month/filename"""
-    now = timezone.now()
-    return f'recordings/{instance.patient.id}/{now.year}/{now.month}/{filename}'
+    return build_audio_path(instance.patient.id, filename)
+
+
+def spectrogram_upload_path(instance, filename):
+    """Store the spectrogram next to the recording it was drawn from"""
+    return f'{os.path.dirname(instance.audio_file.name)}/{filename}'
 
 
 def get_audio_storage():
@@ -25,11 +36,26 @@ def get_audio_storage():
         try:
             return SupabaseStorage()
         except Exception as e:
-            logger.error(f"Failed to initialize SupabaseStorage, falling back to FileSystemStorage: {e}")
-            return FileSystemStorage()
+            logger.error(f"Failed to initialize SupabaseStorage, falling back to LocalStorage: {e}")
+            return LocalStorage()
     else:
-        logger.info("Using FileSystemStorage for non-production")
-        return FileSystemStorage()
+        logger.info("Using LocalStorage for non-production")
+        return LocalStorage()
+
+
+class AudioBlob(models.Model):
+    """Stored audio object shared by every recording with identical content"""
+
+    sha256 = models.CharField(max_length=64, unique=True, help_text="Hash of the uploaded bytes")
+    path = models.CharField(max_length=255, help_text="Storage name of the object")
+    size_bytes = models.BigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    archive_format = models.CharField(max_length=10, blank=True)
+    original_path = models.CharField(max_length=255, blank=True, help_text="Pre-archive object, if still kept")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Blob {self.sha256[:12]} ({self.ref_count} refs)"
 
 
 class AudioRecording(models.Model):
@@ -47,18 +73,77 @@ class AudioRecording(models.Model):
         upload_to=audio_upload_path,
         storage=get_audio_storage
     )
+    blob = models.ForeignKey(
+        AudioBlob,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='recordings',
+        help_text="Shared content-addressed object backing audio_file"
+    )
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     duration_seconds = models.FloatField(null=True, blank=True)
     file_size_bytes = models.IntegerField(null=True, blank=True)
     recorded_at = models.DateTimeField(auto_now_add=True)
+    queued_at = models.DateTimeField(null=True, blank=True, help_text="When analysis was handed to a worker queue")
+    heartbeat_at = models.DateTimeField(null=True, blank=True, help_text="Last sign of life from the analysis pipeline")
+    reap_count = models.PositiveSmallIntegerField(default=0, help_text="Times the stuck-job reaper requeued this")
     processed_at = models.DateTimeField(null=True, blank=True)
     error_message = models.TextField(blank=True)
+    stage_timings = models.JSONField(default=dict, blank=True, help_text="Seconds spent in each pipeline stage")
+    analysis = models.OneToOneField(
+        'AnalysisResult',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        help_text="Current analysis; older model versions stay in analyses"
+    )
+
+    # Precomputed visuals (see ai_engine/waveform.py)
+    waveform_peaks = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Base64 int8 min/max peaks per resolution plus duration"
+    )
+    spectrogram_image = models.FileField(
+        upload_to=spectrogram_upload_path,
+        storage=get_audio_storage,
+        blank=True
+    )
+
+    # Archival transcoding (see ai_engine/transcode.py): the original upload is
+    # kept alongside the archive until original_expires_at
+    archive_format = models.CharField(max_length=10, blank=True)
+    original_file = models.FileField(
+        upload_to=audio_upload_path,
+        storage=get_audio_storage,
+        blank=True
+    )
+    original_expires_at = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(null=True, blank=True, help_text="When audio_file was replaced by the archive")
     
     class Meta:
         ordering = ['-recorded_at']
         indexes = [
             models.Index(fields=['patient', '-recorded_at']),
             models.Index(fields=['status']),
+            models.Index(fields=['recorded_at']),  # retention purge
+            models.Index(
+                fields=['recorded_at'],
+                condition=Q(status='pending', queued_at__isnull=True),
+                name='recording_undispatched_idx',
+            ),
+            models.Index(
+                fields=['heartbeat_at'],
+                condition=Q(status__in=['pending', 'processing'], heartbeat_at__isnull=False),
+                name='recording_in_flight_idx',
+            ),
+            models.Index(
+                fields=['original_expires_at'],
+                condition=Q(original_expires_at__isnull=False),
+                name='recording_original_expiry_idx',
+            ),
         ]
     
     def __str__(self):
@@ -67,12 +152,81 @@ class AudioRecording(models.Model):
     @property
     def filename(self):
         return os.path.basename(self.audio_file.name)
+
+    # Status transitions: conditional UPDATEs that write only the named columns,
+    # so concurrent writers (pipeline stages, reaper, replays) can't clobber
+    # each other's fields or resurrect a recording someone else has moved on
+
+    def transition(self, to_status, from_statuses, **fields):
+        """Move to to_status only if still in from_statuses; False if another writer got there first"""
+        updated = AudioRecording.objects.filter(pk=self.pk, status__in=from_statuses).update(
+            status=to_status, **fields
+        )
+        if not updated:
+            return False
+        self.status = to_status
+        for name, value in fields.items():
+            setattr(self, name, value)
+        return True
+
+    def start_processing(self):
+        """pending -> processing; False when another worker already claimed it"""
+        return self.transition('processing', ['pending'], heartbeat_at=timezone.now())
+
+    def heartbeat(self, min_interval=0):
+        """
+        Tell the stuck-job reaper the pipeline is alive; False if no longer
+        processing. While the last heartbeat is younger than min_interval
+        seconds the (already loaded) status is checked without writing.
+        """
+        now = timezone.now()
+        if min_interval and self.heartbeat_at and (now - self.heartbeat_at).total_seconds() < min_interval:
+            return self.status == 'processing'
+        if not AudioRecording.objects.filter(pk=self.pk, status='processing').update(heartbeat_at=now):
+            return False
+        self.heartbeat_at = now
+        return True
+
+    def schedule_retry(self, message, requeue=False):
+        """Note a transient failure; requeue=True hands the recording back to pending"""
+        return self.transition(
+            'pending' if requeue else 'processing', ['processing'],
+            error_message=f'Retrying after: {message}', heartbeat_at=timezone.now(),
+        )
+
+    def mark_failed(self, message):
+        return self.transition('failed', ['processing'], error_message=str(message))
+
+    def complete(self, analysis_fields, **fields):
+        """
+        Store the analysis (upsert per model version), make it current and
+        move processing -> completed in one short transaction. Returns the
+        AnalysisResult, or None (nothing written) if the recording was moved
+        on meanwhile, e.g. by the reaper.
+        """
+        with transaction.atomic():
+            analysis, _ = AnalysisResult.objects.update_or_create(
+                recording=self, model_version=analysis_fields['model_version'], defaults=analysis_fields
+            )
+            if not self.transition(
+                'completed', ['processing'], processed_at=timezone.now(), error_message='', analysis=analysis, **fields
+            ):
+                transaction.set_rollback(True)
+                return None
+        return analysis
     
     def delete(self, *args, **kwargs):
-        """Delete audio file when model is deleted"""
-        if self.audio_file:
-            self.audio_file.storage.delete(self.audio_file.name)
-        super().delete(*args, **kwargs)
+        """Delete audio files when model is deleted; a shared blob goes with its last reference"""
+        blob_id = self.blob_id
+        names = [self.spectrogram_image.name]
+        if not blob_id:
+            names += [self.audio_file.name, self.original_file.name]
+        self.audio_file.storage.delete_many(names)
+        result = super().delete(*args, **kwargs)
+        if blob_id:
+            from .blobs import release_blob
+            release_blob(blob_id)
+        return result
 
 
 class AnalysisResult(models.Model):
@@ -85,7 +239,8 @@ class AnalysisResult(models.Model):
         ('severe', 'Severe'),
     ]
     
-    recording = models.OneToOneField(AudioRecording, on_delete=models.CASCADE, related_name='analysis')
+    # One result per model version; AudioRecording.analysis points at the current one
+    recording = models.ForeignKey(AudioRecording, on_delete=models.CASCADE, related_name='analyses')
     
     # Transcription Results
     actual_transcript = models.TextField(help_text="What the AI heard")
@@ -135,10 +290,29 @@ class AnalysisResult(models.Model):
         indexes = [
             models.Index(fields=['recording']),
             models.Index(fields=['severity']),
+            models.Index(fields=['model_version', 'recording']),  # version comparisons
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['recording', 'model_version'], name='analysis_recording_version_uniq'),
         ]
     
     def __str__(self):
         return f"Analysis {self.id} - {self.severity} - {self.mismatch_percentage:.1f}%"
+
+    @classmethod
+    def compare_versions(cls, baseline, candidate):
+        """Candidate results side by side with the baseline's for the same recordings, in one query"""
+        return (
+            cls.objects
+            .filter(model_version=candidate, recording__analyses__model_version=baseline)
+            .annotate(
+                baseline_id=F('recording__analyses__id'),
+                baseline_severity=F('recording__analyses__severity'),
+                baseline_mismatch_percentage=F('recording__analyses__mismatch_percentage'),
+                baseline_confidence_score=F('recording__analyses__confidence_score'),
+            )
+            .order_by('recording_id')
+        )
     
     @property
     def is_stuttering_detected(self):
@@ -153,3 +327,35 @@ class AnalysisResult(models.Model):
             'severe': '#ef4444',  # red
         }
         return colors.get(self.severity, '#6b7280')
+
+
+class DeadLetter(models.Model):
+    """Analysis job that failed for good; replay with `manage.py replay_dead_letters`"""
+
+    REASON_CHOICES = [
+        ('permanent', 'Permanent error'),
+        ('exhausted', 'Retries exhausted'),
+        ('stuck', 'Worker stopped responding'),
+    ]
+
+    recording = models.ForeignKey(AudioRecording, on_delete=models.CASCADE, related_name='dead_letters')
+    task_name = models.CharField(max_length=200)
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    exception_type = models.CharField(max_length=200)
+    error_message = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=1)
+    failed_at = models.DateTimeField(auto_now_add=True)
+    replayed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-failed_at']
+        indexes = [
+            models.Index(
+                fields=['failed_at'],
+                condition=Q(replayed_at__isnull=True),
+                name='deadletter_unreplayed_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"Dead letter {self.id} - recording {self.recording_id} - {self.exception_type}"
@@ -0,0 +1,152 @@
+# diagnosis/queues.py
+"""
+Analysis queue selection and backlog signals.
+
+Queue depth is read straight from the Redis broker, and throughput is
+counted per minute by the workers. Together they drive the metrics that
+autoscalers use and the queued-ETA estimates sent back to uploads.
+"""
+import logging
+import time
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from core.redis_client import get_redis
+from .models import AudioRecording
+
+logger = logging.getLogger(__name__)
+
+# Queues (see CELERY_TASK_ROUTES) and broker priorities; lower is served first
+QUEUE_INTERACTIVE = 'interactive'
+QUEUE_LONG = 'long'
+QUEUE_BATCH = 'batch'
+# Pipeline stage pools (download, decode/resample, database writes)
+QUEUE_IO = 'io'
+QUEUE_CPU = 'cpu'
+QUEUE_DB = 'db'
+QUEUES = (QUEUE_INTERACTIVE, QUEUE_LONG, QUEUE_BATCH, QUEUE_IO, QUEUE_CPU, QUEUE_DB)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_LONG = 3
+PRIORITY_BATCH = 9
+
+THROUGHPUT_KEY = 'analysis_done'
+THROUGHPUT_WINDOW_MINUTES = 5
+
+
+def choose_queue(recording, interactive=True):
+    """(queue, priority) for analysing a recording"""
+    if not interactive:
+        return QUEUE_BATCH, PRIORITY_BATCH
+    if (recording.file_size_bytes or 0) > settings.ANALYSIS_LONG_RECORDING_BYTES:
+        return QUEUE_LONG, PRIORITY_LONG
+    return QUEUE_INTERACTIVE, PRIORITY_INTERACTIVE
+
+
+def queue_depths():
+    """
+    Messages waiting per queue. The Redis transport keeps one list per
+    priority step ('queue', 'queue:1', ... 'queue:9'), so all are summed.
+    Returns None for every queue when the broker can't be reached.
+    """
+    options = settings.CELERY_BROKER_TRANSPORT_OPTIONS
+    sep = options.get('sep', ':')
+    steps = options.get('priority_steps', [0])
+    try:
+        pipe = get_redis(settings.CELERY_BROKER_URL).pipeline(transaction=False)
+        for queue in QUEUES:
+            for step in steps:
+                pipe.llen(queue if step == 0 else f'{queue}{sep}{step}')
+        lengths = pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Could not read queue depth from the broker: {e}")
+        return {queue: None for queue in QUEUES}
+
+    depths = {}
+    for i, queue in enumerate(QUEUES):
+        depths[queue] = sum(lengths[i * len(steps):(i + 1) * len(steps)])
+    return depths
+
+
+def record_completion():
+    """Count one finished analysis in the current minute's bucket"""
+    key = f'{THROUGHPUT_KEY}:{int(time.time() // 60)}'
+    cache.add(key, 0, timeout=(THROUGHPUT_WINDOW_MINUTES + 2) * 60)
+    try:
+        cache.incr(key)
+    except ValueError:  # expired between add() and incr()
+        cache.set(key, 1, timeout=(THROUGHPUT_WINDOW_MINUTES + 2) * 60)
+
+
+def throughput():
+    """Analyses completed per second over the last few minutes"""
+    now = time.time()
+    minute = int(now // 60)
+    keys = [f'{THROUGHPUT_KEY}:{m}' for m in range(minute - THROUGHPUT_WINDOW_MINUTES + 1, minute + 1)]
+    done = sum(cache.get_many(keys).values())
+    elapsed = (THROUGHPUT_WINDOW_MINUTES - 1) * 60 + (now % 60)
+    return done / elapsed if elapsed else 0.0
+
+
+def estimate_wait(queue, depths=None, rate=None):
+    """Rough seconds until a job queued now starts, or None when unknown"""
+    depths = depths if depths is not None else queue_depths()
+    rate = rate if rate is not None else throughput()
+    depth = depths.get(queue)
+    if depth is None:
+        return None
+    if depth == 0:
+        return 0
+    if rate <= 0:
+        return None
+    return int(depth / rate)
+
+
+def is_congested(depths):
+    """True once any analysis queue backs up past ANALYSIS_BACKPRESSURE_DEPTH"""
+    return any(
+        (depths.get(queue) or 0) >= settings.ANALYSIS_BACKPRESSURE_DEPTH
+        for queue in (QUEUE_INTERACTIVE, QUEUE_LONG)
+    )
+
+
+def admission(recording):
+    """Where a fresh upload was queued and roughly how long it will wait"""
+    queue, _ = choose_queue(recording)
+    depths = queue_depths()
+    return {
+        'queue': queue,
+        'depth': depths.get(queue),
+        'eta_seconds': estimate_wait(queue, depths),
+        'congested': is_congested(depths),
+    }
+
+
+def get_backlog_stats():
+    """Autoscaling signals: queue depth, oldest waiting recording, in-flight counts"""
+    depths = queue_depths()
+    rate = throughput()
+    in_flight = dict(
+        AudioRecording.objects
+        .filter(status__in=('pending', 'processing'))
+        .values('status')
+        .annotate(n=Count('id'))
+        .values_list('status', 'n')
+    )
+    oldest = AudioRecording.objects.filter(status='pending').aggregate(oldest=Min('recorded_at'))['oldest']
+    waiting = AudioRecording.objects.filter(status='pending', queued_at__isnull=True).count()
+
+    return {
+        'queue_depth': depths,
+        'pending': in_flight.get('pending', 0),
+        'processing': in_flight.get('processing', 0),
+        'waiting_for_slot': waiting,
+        'oldest_pending_recorded_at': oldest.isoformat() if oldest else None,
+        'oldest_pending_age_seconds': int((timezone.now() - oldest).total_seconds()) if oldest else 0,
+        'throughput_per_minute': round(rate * 60, 2),
+        'estimated_wait_seconds': {queue: estimate_wait(queue, depths, rate) for queue in QUEUES},
+        'congested': is_congested(depths),
+    }
@@ -0,0 +1,56 @@
+# diagnosis/retry_policy.py
+"""
+Retry policy for analysis jobs.
+
+Only transient failures are retried: timeouts, connection errors, 5xx and
+429 responses. They back off exponentially with random jitter, so workers
+do not retry in lockstep. Anything else, like a missing file, a 4xx or
+undecodable audio, fails on the first attempt. A job that fails for good
+is written to the DeadLetter table, where it can be replayed.
+"""
+import logging
+import random
+
+import requests
+from django.conf import settings
+from django.db import OperationalError
+
+from .models import DeadLetter
+
+logger = logging.getLogger(__name__)
+
+TRANSIENT_ERRORS = (
+    requests.Timeout,
+    requests.ConnectionError,
+    ConnectionError,
+    TimeoutError,
+    OperationalError,
+)
+
+
+def is_transient(exc):
+    """True when the same job is likely to succeed if tried again later"""
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        status = exc.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
+def backoff_seconds(retries):
+    """Capped exponential backoff with jitter for the given retry number (0-based)"""
+    ceiling = min(settings.ANALYSIS_RETRY_MAX_SECONDS, settings.ANALYSIS_RETRY_BASE_SECONDS * 2 ** retries)
+    return int(random.uniform(settings.ANALYSIS_RETRY_BASE_SECONDS / 2, ceiling))
+
+
+def dead_letter(task, recording_id, exc, reason):
+    """Park a job that will not be retried again"""
+    letter = DeadLetter.objects.create(
+        recording_id=recording_id,
+        task_name=task.name,
+        reason=reason,
+        exception_type=type(exc).__name__,
+        error_message=str(exc)[:2000],
+        attempts=task.request.retries + 1,
+    )
+    logger.error(f"☠️ Recording {recording_id} dead-lettered ({reason}, {letter.attempts} attempts): {exc}")
+    return letter
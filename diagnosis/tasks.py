@@ -1,19 +1,99 @@
 # diagnosis/tasks.py
-from celery import shared_task
+from celery import chain, shared_task
+from celery.exceptions import Ignore
 from django.utils import timezone
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Window
+from django.db.models.functions import RowNumber
+from collections import Counter
+from datetime import timedelta
+import json
 import logging
 import librosa
+import random
+import shutil
 import tempfile
+import time
 import os
+import soundfile as sf
 
-from .models import AudioRecording, AnalysisResult
+from django.core.files import File
+from django.core.files.base import ContentFile
+
+from core.locks import lease
+from reports.progress import record_analysis
+from reports.tasks import generate_session_report
+from .blobs import adopt_recording, copy_and_hash, release_blobs, sha256_of
+from .models import AudioBlob, AudioRecording, AnalysisResult, DeadLetter
+from .queues import PRIORITY_BATCH, QUEUE_BATCH, choose_queue, is_congested, queue_depths, record_completion
+from .retry_policy import backoff_seconds, dead_letter, is_transient
 from .ai_engine.model_loader import get_stutter_detector, log_model_cache_info
+from .ai_engine.transcode import archive_extension, build_archive
+from .ai_engine.waveform import build_visuals
 
 logger = logging.getLogger(__name__)
 
 
-@shared_task(bind=True, max_retries=3)
+def enqueue_analysis(recording, interactive=True):
+    """
+    Queue analysis of a recording where it fits: a patient waiting on the
+    result goes to 'interactive' (or 'long' for large files), backfills and
+    reprocessing go to 'batch'. Batch work is held back while the
+    interactive queues are congested.
+    """
+    queue, priority = choose_queue(recording, interactive)
+    options = {}
+    if queue == QUEUE_BATCH and is_congested(queue_depths()):
+        options['countdown'] = settings.ANALYSIS_BATCH_DEFER_SECONDS
+
+    # Conditional update so a recording is only ever queued once
+    now = timezone.now()
+    claimed = AudioRecording.objects.filter(pk=recording.pk, queued_at__isnull=True).update(queued_at=now, heartbeat_at=now)
+    if not claimed:
+        return None
+    return analysis_pipeline(recording.id, queue, priority).apply_async(**options)
+
+
+def _in_flight(patient_ids):
+    """Queued or running analyses per patient"""
+    rows = (
+        AudioRecording.objects
+        .filter(patient_id__in=patient_ids, status__in=('pending', 'processing'), queued_at__isnull=False)
+        .values('patient_id')
+        .annotate(n=Count('id'))
+    )
+    return {row['patient_id']: row['n'] for row in rows}
+
+
+def submit_analysis(recording):
+    """
+    Queue a fresh upload straight away if its patient has a free slot,
+    otherwise leave it pending for the fair-share dispatcher.
+    """
+    if _in_flight([recording.patient_id]).get(recording.patient_id, 0) < settings.ANALYSIS_MAX_INFLIGHT_PER_PATIENT:
+        return enqueue_analysis(recording)
+    logger.info(f"⏳ Recording {recording.id} waiting for a fair-share slot")
+    return None
+
+
+# Analysis pipeline: fetch -> preprocess -> infer -> persist -> aggregate.
+# Each stage is its own task on a pool sized for its bottleneck (see
+# CELERY_TASK_ROUTES). Intermediate files live in ANALYSIS_WORK_DIR, so a
+# retried stage picks up where the previous attempt left off.
+
+def analysis_pipeline(recording_id, queue, priority):
+    """Stage chain for one recording; inference runs on its priority queue"""
+    return chain(
+        fetch_recording_audio.si({'recording_id': recording_id}).set(priority=priority),
+        preprocess_recording_audio.s().set(priority=priority),
+        infer_recording_analysis.s().set(queue=queue, priority=priority),
+        persist_recording_analysis.s().set(priority=priority),
+        aggregate_recording_analysis.s().set(priority=priority),
+    )
+
+
+@shared_task(bind=True)
 def process_audio_recording(self, recording_id):
     """
     Async task to process audio recording (MVP Simplified)
@@ -21,95 +101,349 @@ def process_audio_recording(self, recording_id):
     1. Audio Input
     2. AI Diagnosis (Articulation analysis)
     3. Results Storage
+
+    Kept as the entry point for already queued messages: starts the staged pipeline.
     """
-    
+    recording = AudioRecording.objects.get(id=recording_id)
+    interactive = (self.request.delivery_info or {}).get('routing_key') != QUEUE_BATCH
+    queue, priority = choose_queue(recording, interactive)
+    return analysis_pipeline(recording_id, queue, priority).delay().id
+
+
+def _work_path(recording_id, name):
+    path = os.path.join(settings.ANALYSIS_WORK_DIR, str(recording_id))
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, name)
+
+
+def _write_atomic(path, write):
+    """Write via a temp file and rename, so a crashed attempt never leaves a partial artifact"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
     try:
-        logger.info(f"🎯 Processing recording {recording_id}")
-        
-        # Get recording
-        recording = AudioRecording.objects.get(id=recording_id)
-        recording.status = 'processing'
-        recording.save()
-
-        # Download audio file to temp location for processing
-        temp_audio_path = None
-        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(recording.audio_file.name)[1]) as temp_file:
-            temp_file.write(recording.audio_file.read())
-            temp_audio_path = temp_file.name
-        audio_path = temp_audio_path
-        
-        # Calculate duration
+        with os.fdopen(fd, 'wb') as f:
+            result = write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return result
+
+
+def _source_path(recording):
+    """Local copy of the uploaded audio, downloaded once per recording"""
+    path = _work_path(recording.id, 'source' + os.path.splitext(recording.audio_file.name)[1])
+    if not os.path.exists(path):
+        digest, size = _write_atomic(path, lambda f: copy_and_hash(recording.audio_file, f))
+        # Direct uploads reach storage without being hashed; dedupe them now
+        if recording.blob_id is None:
+            adopt_recording(recording, digest, size)
+    elif recording.blob_id is None:
+        with open(path, 'rb') as f:
+            adopt_recording(recording, sha256_of(File(f)), os.path.getsize(path))
+    return path
+
+
+def _fail_recording(task, recording, exc, transient):
+    logger.error(f"❌ Processing failed for recording {recording.id} in {task.name}: {exc}")
+    shutil.rmtree(os.path.join(settings.ANALYSIS_WORK_DIR, str(recording.id)), ignore_errors=True)
+    # A recording that already completed (a failure in aggregate) stays
+    # completed, and there is nothing for replay_dead_letters to requeue
+    if not recording.mark_failed(exc):
+        return
+    dead_letter(task, recording.id, exc, reason='exhausted' if transient else 'permanent')
+    # A slot just freed up for this patient
+    dispatch_pending_analyses.delay()
+
+
+def _run_stage(task, stage, payload, work, expect='processing', claim=False, heartbeat=True):
+    """
+    Run one pipeline stage under a per-stage lease. Stage durations (and the
+    duration of the audio) travel in the payload and are written together
+    with the completed transition, not one UPDATE per stage. The heartbeat
+    is only written once it is ANALYSIS_HEARTBEAT_SECONDS old, so a job that
+    moves along writes just its claim and its completion. Transient errors
+    retry this stage only; permanent ones fail the recording and stop the
+    chain. A stage that finds nothing to do ends the chain quietly.
+    """
+    if not payload:  # an earlier stage had nothing to do
+        raise Ignore()
+    recording_id = payload['recording_id']
+    with lease(f'recording:{recording_id}:{stage}', settings.ANALYSIS_LEASE_SECONDS) as held:
+        if not held:
+            logger.info(f"🔒 Recording {recording_id} {stage} is already running, skipping")
+            raise Ignore()
+
+        recording = AudioRecording.objects.filter(id=recording_id).first()
+        if recording is None:
+            logger.error(f"❌ Recording {recording_id} not found")
+            raise Ignore()
+        if claim:
+            started_ok = recording.start_processing()
+        elif expect == 'processing' and heartbeat:
+            started_ok = recording.heartbeat(settings.ANALYSIS_HEARTBEAT_SECONDS)
+        elif expect == 'processing':
+            started_ok = recording.status == 'processing'
+        else:
+            started_ok = recording.status == expect
+        if not started_ok:
+            logger.info(f"⏭️ Recording {recording_id} is {recording.status}, skipping {stage}")
+            raise Ignore()
+
+        started = time.monotonic()
         try:
-            duration = librosa.get_duration(path=audio_path)
-            recording.duration_seconds = round(duration, 2)
-            recording.save()
-            logger.info(f"📏 Audio duration: {duration:.2f} seconds")
+            result = work(recording)
         except Exception as e:
-            logger.warning(f"⚠️ Could not calculate duration: {e}")
-        
+            transient = is_transient(e)
+            if transient and task.request.retries < task.max_retries:
+                countdown = backoff_seconds(task.request.retries)
+                logger.warning(
+                    f"🔁 Transient failure for recording {recording_id} in {stage} ({type(e).__name__}: {e}), "
+                    f"retry {task.request.retries + 1}/{task.max_retries} in {countdown}s"
+                )
+                recording.schedule_retry(e, requeue=claim)
+                raise task.retry(exc=e, countdown=countdown)
+            _fail_recording(task, recording, e, transient)
+            raise
+
+        elapsed = time.monotonic() - started
+        logger.info(f"⏱️ Recording {recording_id} {stage} took {elapsed:.2f}s")
+        if not result:
+            raise Ignore()
+        return {**result, 'timings': {**payload.get('timings', {}), stage: round(elapsed, 3)}}
+
+
+@shared_task(bind=True, max_retries=settings.ANALYSIS_MAX_RETRIES)
+def fetch_recording_audio(self, payload):
+    """Stage 1 (I/O): download the upload into the work directory"""
+    def work(recording):
+        logger.info(f"🎯 Processing recording {recording.id}")
+        _source_path(recording)
+        return payload
+    return _run_stage(self, 'fetch', payload, work, claim=True)
+
+
+@shared_task(bind=True, max_retries=settings.ANALYSIS_MAX_RETRIES)
+def preprocess_recording_audio(self, payload):
+    """
+    Stage 2 (CPU): decode and resample to AUDIO_SAMPLE_RATE mono WAV, and
+    measure the duration. Audio this worker can't decode is passed to
+    inference as uploaded, exactly as before the pipeline existed.
+    """
+    def work(recording):
+        wav_path = _work_path(recording.id, 'audio.wav')
+        if os.path.exists(wav_path):
+            duration = sf.info(wav_path).duration
+        else:
+            try:
+                y, sr = librosa.load(_source_path(recording), sr=settings.AUDIO_SAMPLE_RATE, mono=True)
+            except Exception as e:
+                logger.warning(f"⚠️ Could not decode recording {recording.id}, sending it as uploaded: {e}")
+                return payload
+            _write_atomic(wav_path, lambda f: sf.write(f, y, sr, format='WAV', subtype='PCM_16'))
+            duration = len(y) / sr
+
+        logger.info(f"📏 Audio duration: {duration:.2f} seconds")
+        # Written with the completed transition
+        return {**payload, 'duration_seconds': round(duration, 2)}
+    return _run_stage(self, 'preprocess', payload, work)
+
+
+@shared_task(bind=True, max_retries=settings.ANALYSIS_MAX_RETRIES)
+def infer_recording_analysis(self, payload):
+    """Stage 3 (API): run the stutter detector; the response is kept so retries never call it twice"""
+    def work(recording):
+        cached_path = _work_path(recording.id, 'analysis.json')
+        if os.path.exists(cached_path):
+            with open(cached_path) as f:
+                return {**payload, 'analysis': json.load(f)}
+
+        wav_path = _work_path(recording.id, 'audio.wav')
+        audio_path = wav_path if os.path.exists(wav_path) else _source_path(recording)
+
         # Load AI detector and analyze audio via external API
         logger.info(f"🤖 Loading AI detector (external API mode)...")
         log_model_cache_info()  # Log API mode info
         detector = get_stutter_detector()
-        
-        logger.info(f"🎵 Analyzing audio via external ML API...")
-        logger.info(f"🎵 Audio path: {audio_path}")
-        logger.info(f"🎵 Audio file exists: {os.path.exists(audio_path)}")
+
+        logger.info(f"🎵 Analyzing audio via external ML API: {audio_path}")
         analysis_data = detector.analyze_audio(audio_path)
-        
-        # Save analysis results
-        analysis = AnalysisResult.objects.create(
-            recording=recording,
-            actual_transcript=analysis_data['actual_transcript'],
-            target_transcript=analysis_data['target_transcript'],
-            mismatched_chars=analysis_data['mismatched_chars'],
-            mismatch_percentage=analysis_data['mismatch_percentage'],
-            ctc_loss_score=analysis_data['ctc_loss_score'],
-            stutter_timestamps=analysis_data['stutter_timestamps'],
-            total_stutter_duration=analysis_data['total_stutter_duration'],
-            stutter_frequency=analysis_data['stutter_frequency'],
-            severity=analysis_data['severity'],
-            confidence_score=analysis_data['confidence_score'],
-            analysis_duration_seconds=analysis_data['analysis_duration_seconds'],
-            model_version=analysis_data['model_version']
-        )
-        
-        # Update recording status
-        recording.status = 'completed'
-        recording.processed_at = timezone.now()
-        recording.save()
-        
-        logger.info(f"✅ Recording {recording_id} processed successfully")
-        
+        _write_atomic(cached_path, lambda f: f.write(json.dumps(analysis_data).encode()))
+        return {**payload, 'analysis': analysis_data}
+    return _run_stage(self, 'infer', payload, work)
+
+
+def _analysis_fields(analysis_data):
+    """AnalysisResult fields from a detector response"""
+    return dict(
+        actual_transcript=analysis_data['actual_transcript'],
+        target_transcript=analysis_data['target_transcript'],
+        mismatched_chars=analysis_data['mismatched_chars'],
+        mismatch_percentage=analysis_data['mismatch_percentage'],
+        ctc_loss_score=analysis_data['ctc_loss_score'],
+        stutter_timestamps=analysis_data['stutter_timestamps'],
+        total_stutter_duration=analysis_data['total_stutter_duration'],
+        stutter_frequency=analysis_data['stutter_frequency'],
+        severity=analysis_data['severity'],
+        confidence_score=analysis_data['confidence_score'],
+        analysis_duration_seconds=analysis_data['analysis_duration_seconds'],
+        model_version=analysis_data['model_version'],
+    )
+
+
+@shared_task(bind=True, max_retries=settings.ANALYSIS_MAX_RETRIES)
+def persist_recording_analysis(self, payload):
+    """Stage 4 (DB): store the result, complete the recording and update daily progress in one transaction"""
+    def work(recording):
+        # Timings of the stages before this one; persist's own is only logged,
+        # as it isn't known until after the one write that stores them
+        fields = {'stage_timings': payload.get('timings', {})}
+        if 'duration_seconds' in payload:
+            fields['duration_seconds'] = payload['duration_seconds']
+
+        with transaction.atomic():
+            analysis = recording.complete(_analysis_fields(payload['analysis']), **fields)
+            if analysis is not None:
+                record_analysis(recording, analysis)
+        if analysis is None:
+            logger.info(f"⏭️ Recording {recording.id} moved on before its result was stored")
+            return None
+
+        logger.info(f"✅ Recording {recording.id} processed successfully")
         return {
-            'recording_id': recording_id,
+            'recording_id': recording.id,
+            'timings': payload.get('timings', {}),
             'analysis_id': analysis.id,
             'severity': analysis.severity,
             'mismatch_percentage': analysis.mismatch_percentage
         }
+    # complete() is conditional on processing, so no heartbeat write first
+    return _run_stage(self, 'persist', payload, work, heartbeat=False)
 
-    except AudioRecording.DoesNotExist:
-        logger.error(f"❌ Recording {recording_id} not found")
-        raise
 
-    except Exception as e:
-        logger.error(f"❌ Processing failed for recording {recording_id}: {e}")
+@shared_task(bind=True, max_retries=settings.ANALYSIS_MAX_RETRIES)
+def aggregate_recording_analysis(self, payload):
+    """Stage 5 (DB): throughput stats, follow-up work and cleanup once a recording completes"""
+    def work(recording):
+        record_completion()
 
-        try:
-            recording = AudioRecording.objects.get(id=recording_id)
-            recording.status = 'failed'
-            recording.error_message = str(e)
-            recording.save()
-        except:
-            pass
+        # Post-analysis stages, independent so one failing never holds up the others
+        generate_recording_visuals.delay(recording.id)
+        archive_recording_audio.delay(recording.id)
+        generate_session_report.apply_async(args=[recording.id], priority=PRIORITY_BATCH)
+
+        shutil.rmtree(os.path.join(settings.ANALYSIS_WORK_DIR, str(recording.id)), ignore_errors=True)
+        # A slot just freed up for this patient
+        dispatch_pending_analyses.delay()
+        return payload
+    return _run_stage(self, 'aggregate', payload, work, expect='completed')
+
+
+@shared_task(ignore_result=True)
+def reap_stuck_analyses(batch_size=None):
+    """
+    Periodic: find analyses whose pipeline went quiet (worker OOM-killed,
+    restarted, message lost) and requeue them, or fail them once they have
+    been requeued ANALYSIS_MAX_REAPS times. Reads only in-flight rows through
+    the partial heartbeat index, so the scan is O(stuck rows), not O(table).
+    """
+    batch_size = batch_size or settings.ANALYSIS_REAP_BATCH_SIZE
+    now = timezone.now()
+    processing_cutoff = now - timedelta(seconds=settings.ANALYSIS_STALE_PROCESSING_SECONDS)
+    queued_cutoff = now - timedelta(seconds=settings.ANALYSIS_STALE_QUEUED_SECONDS)
+
+    # Queued-but-not-started jobs may just be behind a long backlog, so they
+    # get longer; the split is in SQL so waiting rows never crowd the LIMIT
+    stale = (
+        Q(status='processing', heartbeat_at__lt=processing_cutoff)
+        | Q(status='pending', heartbeat_at__lt=queued_cutoff)
+    )
+    stuck = list(
+        AudioRecording.objects
+        # status__in and isnull match the partial heartbeat index's condition
+        .filter(stale, status__in=('pending', 'processing'), heartbeat_at__isnull=False)
+        .order_by('heartbeat_at')
+        .values_list('id', 'reap_count')[:batch_size]
+    )
+    if not stuck:
+        return {'requeued': 0, 'failed': 0}
+
+    requeue = [pk for pk, reaps in stuck if reaps < settings.ANALYSIS_MAX_REAPS]
+    give_up = [pk for pk, reaps in stuck if reaps >= settings.ANALYSIS_MAX_REAPS]
+
+    with transaction.atomic():
+        # Back to the fair-share dispatcher, which queues them again; the
+        # stale filter is repeated so a stage that just checked in is left alone
+        requeued = AudioRecording.objects.filter(stale, id__in=requeue).update(
+            status='pending', queued_at=None, heartbeat_at=None, reap_count=F('reap_count') + 1,
+            error_message='Requeued after the worker stopped responding',
+        )
+        failed_ids = list(AudioRecording.objects.filter(stale, id__in=give_up).values_list('id', flat=True))
+        AudioRecording.objects.filter(id__in=failed_ids).update(
+            status='failed', heartbeat_at=None, error_message='Analysis stopped responding repeatedly',
+        )
+        DeadLetter.objects.bulk_create([
+            DeadLetter(
+                recording_id=pk,
+                task_name=process_audio_recording.name,
+                reason='stuck',
+                exception_type='WorkerLost',
+                error_message='No heartbeat from the analysis pipeline',
+                attempts=settings.ANALYSIS_MAX_REAPS + 1,
+            )
+            for pk in failed_ids
+        ])
+
+    for pk in failed_ids:
+        shutil.rmtree(os.path.join(settings.ANALYSIS_WORK_DIR, str(pk)), ignore_errors=True)
+    if requeued:
+        dispatch_pending_analyses.delay()
+    logger.warning(f"🪦 Reaper requeued {requeued} and failed {len(failed_ids)} stuck analyses")
+    return {'requeued': requeued, 'failed': len(failed_ids)}
+
+
+@shared_task(ignore_result=True)
+def dispatch_pending_analyses(batch_size=None):
+    """
+    Fair-share dispatcher: hand waiting recordings to the worker queues
+    round-robin across patients (each patient's oldest first), never giving a
+    patient more than ANALYSIS_MAX_INFLIGHT_PER_PATIENT queued at once.
+    """
+    batch_size = batch_size or settings.ANALYSIS_DISPATCH_BATCH_SIZE
+    cap = settings.ANALYSIS_MAX_INFLIGHT_PER_PATIENT
+    waiting = AudioRecording.objects.filter(status='pending', queued_at__isnull=True)
 
-        # Retry task
-        raise self.retry(exc=e, countdown=60 * (self.request.retries + 1))
+    # Patients with waiting work, longest-waiting first
+    oldest = dict(
+        waiting.values('patient_id')
+        .annotate(oldest=Min('recorded_at'))
+        .order_by('oldest')
+        .values_list('patient_id', 'oldest')[:batch_size]
+    )
+    if not oldest:
+        return 0
+    in_flight = _in_flight(list(oldest))
+    slots = {pid: cap - in_flight.get(pid, 0) for pid in oldest if in_flight.get(pid, 0) < cap}
 
-    finally:
-        # Clean up temp file
-        if temp_audio_path and os.path.exists(temp_audio_path):
-            os.unlink(temp_audio_path)
+    # Each patient's next `cap` recordings, ranked oldest first
+    candidates = (
+        waiting.filter(patient_id__in=list(slots))
+        .annotate(turn=Window(RowNumber(), partition_by=F('patient_id'), order_by=F('recorded_at').asc()))
+        .filter(turn__lte=cap)
+        .only('id', 'patient_id', 'file_size_bytes')
+    )
+    # Round-robin: every patient's first turn, then every patient's second...
+    rounds = sorted(
+        (r for r in candidates if r.turn <= slots[r.patient_id]),
+        key=lambda r: (r.turn, oldest[r.patient_id]),
+    )
+
+    dispatched = 0
+    for recording in rounds[:batch_size]:
+        if enqueue_analysis(recording) is not None:
+            dispatched += 1
+    if dispatched:
+        logger.info(f"📬 Dispatched {dispatched} waiting analyses across {len(slots)} patients")
+    return dispatched
 
 
 # slaq_project/celery.py
@@ -125,4 +459,324 @@ app.autodiscover_tasks()
 
 @app.task(bind=True)
 def debug_task(self):
-    print(f'Request: {self.request!r}')
\ No newline at end of file
+    print(f'Request: {self.request!r}')
+
+
+def _retry_post_analysis(task, recording_id, stage, exc):
+    """
+    Error policy for the post-analysis stages: transient failures retry with
+    backoff, anything else is logged and raised. The analysis itself already
+    completed, so nothing is failed or dead-lettered.
+    """
+    if is_transient(exc) and task.request.retries < task.max_retries:
+        countdown = backoff_seconds(task.request.retries)
+        logger.warning(
+            f"🔁 Transient failure for recording {recording_id} in {stage} ({type(exc).__name__}: {exc}), "
+            f"retry {task.request.retries + 1}/{task.max_retries} in {countdown}s"
+        )
+        raise task.retry(exc=exc, countdown=countdown)
+    logger.error(f"❌ Recording {recording_id} {stage} failed ({type(exc).__name__}: {exc})")
+    raise exc
+
+
+@shared_task(bind=True, max_retries=settings.ANALYSIS_MAX_RETRIES)
+def generate_recording_visuals(self, recording_id):
+    """
+    Post-analysis stage: compute waveform peaks and a spectrogram thumbnail
+    so the stutter timeline can be drawn without fetching the audio.
+    """
+    recording = AudioRecording.objects.get(id=recording_id)
+    try:
+        return _store_recording_visuals(recording)
+    except FileNotFoundError as e:
+        # Archiving runs alongside and may have just replaced the file; read the new one
+        if AudioRecording.objects.filter(pk=recording_id).exclude(audio_file=recording.audio_file.name).exists():
+            raise self.retry(exc=e, countdown=0)
+        _retry_post_analysis(self, recording_id, 'visuals', e)
+    except Exception as e:
+        _retry_post_analysis(self, recording_id, 'visuals', e)
+
+
+def _store_recording_visuals(recording):
+    suffix = os.path.splitext(recording.audio_file.name)[1]
+
+    with tempfile.NamedTemporaryFile(suffix=suffix) as temp_file:
+        with recording.audio_file.open('rb') as audio_file:
+            for chunk in audio_file.chunks():
+                temp_file.write(chunk)
+        temp_file.flush()
+        peaks, spectrogram_png = build_visuals(temp_file.name)
+
+    base_name = os.path.splitext(os.path.basename(recording.audio_file.name))[0]
+    if recording.spectrogram_image:
+        recording.spectrogram_image.delete(save=False)
+    recording.spectrogram_image.save(f'{base_name}_spectrogram.png', ContentFile(spectrogram_png), save=False)
+    recording.waveform_peaks = peaks
+    recording.save(update_fields=['waveform_peaks', 'spectrogram_image'])
+
+    logger.info(f"📈 Visuals stored for recording {recording.id}")
+    return {'recording_id': recording.id, 'spectrogram': recording.spectrogram_image.name}
+
+
+def _copy_to_path(field_file, path):
+    with field_file.open('rb') as source, open(path, 'wb') as target:
+        for chunk in source.chunks():
+            target.write(chunk)
+
+
+def _archive_within_tolerance(recording, report, archive_path):
+    """Signal-level checks on every archive, plus end-to-end re-analysis on a sample"""
+    if report['duration_drift_seconds'] > settings.AUDIO_ARCHIVE_MAX_DURATION_DRIFT:
+        logger.warning(f"⚠️ Archive of recording {recording.id} drifted {report['duration_drift_seconds']:.3f}s")
+        return False
+    if report['spectral_similarity'] < settings.AUDIO_ARCHIVE_MIN_SIMILARITY:
+        logger.warning(f"⚠️ Archive of recording {recording.id} similarity {report['spectral_similarity']:.4f} too low")
+        return False
+
+    if random.random() >= settings.AUDIO_ARCHIVE_VERIFY_SAMPLE_RATE:
+        return True
+    # The current analysis, not the newest row: a shadow re-analysis may be newer
+    analysis = recording.analysis
+    if analysis is None:
+        return True
+
+    archived = get_stutter_detector().analyze_audio(archive_path)
+    delta = abs(archived['mismatch_percentage'] - analysis.mismatch_percentage)
+    logger.info(f"🔍 Archive re-analysis for recording {recording.id}: mismatch moved {delta:.2f} points")
+    if delta > settings.AUDIO_ARCHIVE_MISMATCH_TOLERANCE:
+        logger.warning(f"⚠️ Archive of recording {recording.id} changed mismatch by {delta:.2f} points")
+        return False
+    return True
+
+
+@shared_task(bind=True, max_retries=settings.ANALYSIS_MAX_RETRIES)
+def archive_recording_audio(self, recording_id):
+    """
+    Post-analysis stage: transcode the upload to a compact archival format.
+    The original is kept until AUDIO_ORIGINAL_RETENTION_DAYS have passed, and
+    is never replaced by an archive that fails the fidelity checks. A failed
+    transcode or upload leaves the original in place, so transient errors
+    are retried rather than leaving it there for good.
+    """
+    if not settings.AUDIO_ARCHIVE_ENABLED:
+        return None
+    try:
+        return _archive_recording(recording_id)
+    except Exception as e:
+        _retry_post_analysis(self, recording_id, 'archive', e)
+
+
+def _archive_recording(recording_id):
+    recording = AudioRecording.objects.select_related('blob', 'analysis').get(id=recording_id)
+    if recording.archive_format:
+        return None
+    if recording.blob and recording.blob.archive_format:
+        # Another recording with the same content already archived the shared blob
+        AudioRecording.objects.filter(pk=recording.pk).update(
+            audio_file=recording.blob.path,
+            archive_format=recording.blob.archive_format,
+            file_size_bytes=recording.blob.size_bytes,
+            archived_at=timezone.now(),
+        )
+        return None
+
+    archive_format = settings.AUDIO_ARCHIVE_FORMAT
+    original_name = recording.audio_file.name
+    storage = recording.audio_file.storage
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        src_path = os.path.join(tmp_dir, 'original' + os.path.splitext(original_name)[1])
+        dst_path = os.path.join(tmp_dir, 'archive' + archive_extension(archive_format))
+        _copy_to_path(recording.audio_file, src_path)
+
+        report = build_archive(
+            src_path, dst_path, archive_format,
+            bitrate_kbps=settings.AUDIO_ARCHIVE_BITRATE_KBPS,
+            sample_rate=settings.AUDIO_SAMPLE_RATE,
+        )
+        if report['archive_bytes'] >= report['original_bytes']:
+            logger.info(f"Recording {recording_id} is already compact, keeping the original")
+            return None
+        if not _archive_within_tolerance(recording, report, dst_path):
+            return None
+
+        base_name = os.path.splitext(original_name)[0]
+        with open(dst_path, 'rb') as archive_file:
+            archived_name = storage.save(base_name + archive_extension(archive_format), File(archive_file))
+
+    keep_original = settings.AUDIO_ORIGINAL_RETENTION_DAYS > 0
+    fields = {
+        'audio_file': archived_name,
+        'archive_format': archive_format,
+        'file_size_bytes': report['archive_bytes'],
+        'archived_at': timezone.now(),
+    }
+    if keep_original:
+        fields['original_file'] = original_name
+        fields['original_expires_at'] = timezone.now() + timedelta(days=settings.AUDIO_ORIGINAL_RETENTION_DAYS)
+
+    # A shared blob is archived once, for every recording that references it
+    if recording.blob_id:
+        AudioBlob.objects.filter(pk=recording.blob_id).update(
+            path=archived_name,
+            archive_format=archive_format,
+            size_bytes=report['archive_bytes'],
+            original_path=original_name if keep_original else '',
+        )
+        AudioRecording.objects.filter(blob_id=recording.blob_id).update(**fields)
+    else:
+        AudioRecording.objects.filter(pk=recording.pk).update(**fields)
+
+    if not keep_original:
+        storage.delete(original_name)
+
+    logger.info(f"🗜️ Recording {recording_id} archived as {archived_name}")
+    return {'recording_id': recording_id, **report}
+
+
+@shared_task
+def purge_expired_originals(batch_size=500):
+    """Periodic: drop original uploads whose retention window has passed"""
+    purged = 0
+    while True:
+        expired = list(
+            AudioRecording.objects
+            .filter(original_expires_at__lte=timezone.now())
+            .values_list('id', 'original_file')[:batch_size]
+        )
+        if not expired:
+            break
+
+        storage = AudioRecording._meta.get_field('original_file').storage
+        storage.delete_many({name for _, name in expired if name})
+        AudioRecording.objects.filter(id__in=[pk for pk, _ in expired]).update(
+            original_file='', original_expires_at=None
+        )
+        AudioBlob.objects.filter(original_path__in=[name for _, name in expired if name]).update(original_path='')
+        purged += len(expired)
+
+    logger.info(f"🧹 Purged {purged} expired original uploads")
+    return purged
+
+
+@shared_task
+def purge_expired_recordings(retention_days=None, batch_size=None):
+    """
+    Periodic: delete recordings older than RECORDING_RETENTION_DAYS together
+    with their analysis, visuals and audio. Rows go in chunks, oldest first,
+    and storage objects in batched remove() calls.
+    """
+    retention_days = settings.RECORDING_RETENTION_DAYS if retention_days is None else retention_days
+    batch_size = batch_size or settings.RECORDING_PURGE_BATCH_SIZE
+    if retention_days <= 0:
+        return None
+
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    storage = AudioRecording._meta.get_field('audio_file').storage
+    started = time.monotonic()
+    purged = 0
+    objects = 0
+
+    while True:
+        expired = list(
+            AudioRecording.objects
+            .filter(recorded_at__lt=cutoff)
+            .order_by('recorded_at')
+            .values_list('id', 'blob_id', 'audio_file', 'original_file', 'spectrogram_image')[:batch_size]
+        )
+        if not expired:
+            break
+
+        paths = []
+        blob_refs = Counter()
+        for _, blob_id, audio_file, original_file, spectrogram_image in expired:
+            paths.append(spectrogram_image)
+            if blob_id:
+                blob_refs[blob_id] += 1
+            else:
+                paths += [audio_file, original_file]
+
+        with transaction.atomic():
+            AudioRecording.objects.filter(id__in=[row[0] for row in expired]).delete()
+            paths += release_blobs(blob_refs)
+
+        objects += storage.delete_many(paths)
+        purged += len(expired)
+
+    elapsed = time.monotonic() - started
+    rate = purged / elapsed if elapsed else 0.0
+    logger.info(
+        f"🧹 Purged {purged} recordings and {objects} stored objects older than {cutoff:%Y-%m-%d} "
+        f"in {elapsed:.1f}s ({rate:.0f} recordings/s)"
+    )
+    return {'recordings': purged, 'objects': objects, 'seconds': round(elapsed, 2)}
+
+
+@shared_task(ignore_result=False)
+def reanalyze_recordings(recording_ids, make_current=True, model_version=None):
+    """
+    Batch re-analysis (see the reanalyze_recordings command): run the
+    detector over completed recordings and write the new model version's
+    results with a single bulk_create. Earlier versions are kept; with
+    make_current=False the new results are stored for comparison only.
+    A recording that fails is reported back and picked up by the next run.
+    When the worker's detector isn't model_version nothing is stored and the
+    chunk comes back with 'version_mismatch' set to the version it found.
+    The result is stored so the command can track the batch.
+    """
+    detector = get_stutter_detector()
+    recordings = AudioRecording.objects.filter(id__in=recording_ids, status='completed').only('id', 'audio_file')
+    analyses = {}
+    failed = []
+    started = time.monotonic()
+
+    for recording in recordings:
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                path = os.path.join(tmp_dir, 'source' + os.path.splitext(recording.audio_file.name)[1])
+                _copy_to_path(recording.audio_file, path)
+                fields = _analysis_fields(detector.analyze_audio(path))
+        except Exception as e:
+            logger.warning(f"🔁 Re-analysis of recording {recording.id} failed ({type(e).__name__}: {e})")
+            failed.append(recording.id)
+            continue
+        if model_version and fields['model_version'] != model_version:
+            logger.error(f"🔁 Detector is {fields['model_version']}, not {model_version}; skipping the chunk")
+            return {
+                'done': 0, 'failed': list(recording_ids), 'seconds': round(time.monotonic() - started, 2),
+                'version_mismatch': fields['model_version'],
+            }
+        analyses[recording.id] = fields
+
+    with transaction.atomic():
+        # Lock the rows so a recording deleted meanwhile can't break the insert
+        current = list(
+            AudioRecording.objects.select_for_update()
+            .filter(id__in=list(analyses), status='completed')
+            .only('id', 'patient_id', 'analysis_id', 'recorded_at', 'duration_seconds')
+        )
+        previous = AnalysisResult.objects.in_bulk([r.analysis_id for r in current if r.analysis_id])
+        # A rerun of the same version replaces its earlier rows
+        version_rows = Q()
+        for recording in current:
+            version_rows |= Q(recording_id=recording.id, model_version=analyses[recording.id]['model_version'])
+        if current:
+            AnalysisResult.objects.filter(version_rows).delete()
+        results = AnalysisResult.objects.bulk_create([
+            AnalysisResult(recording_id=recording.id, **analyses[recording.id]) for recording in current
+        ])
+        # A recording whose current analysis was just replaced is re-pointed
+        # even in shadow mode, or the delete would leave it without one
+        repoint = [
+            (recording, result) for recording, result in zip(current, results)
+            if make_current or recording.analysis_id in previous
+            and previous[recording.analysis_id].model_version == result.model_version
+        ]
+        for recording, result in repoint:
+            record_analysis(recording, result, previous.get(recording.analysis_id))
+            recording.analysis = result
+        AudioRecording.objects.bulk_update([recording for recording, _ in repoint], ['analysis'])
+
+    elapsed = time.monotonic() - started
+    logger.info(f"🔬 Re-analysed {len(current)} recordings in {elapsed:.1f}s ({len(failed)} failed)")
+    return {'done': len(current), 'failed': failed, 'seconds': round(elapsed, 2)}
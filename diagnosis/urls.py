@@ -8,11 +8,15 @@ urlpatterns = [
     # Recording
     path('record/', views.record_audio, name='record'),
     path('upload/', views.upload_recording, name='upload'),
+    path('upload/sign/', views.create_upload_url, name='upload_sign'),
+    path('upload/finalize/', views.finalize_upload, name='upload_finalize'),
     
     # Recordings List
     path('recordings/', views.recordings_list, name='recordings_list'),
     path('recordings/<int:recording_id>/', views.recording_detail, name='recording_detail'),
     path('recordings/<int:recording_id>/delete/', views.delete_recording, name='delete_recording'),
+    path('recordings/<int:recording_id>/audio/', views.stream_audio, name='stream_audio'),
+    path('recordings/<int:recording_id>/spectrogram.png', views.recording_spectrogram, name='recording_spectrogram'),
     
     # Analysis
     path('analysis/<int:analysis_id>/', views.analysis_detail, name='analysis_detail'),
@@ -2,20 +2,182 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.core import signing
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.middleware.csrf import get_token
 from django.utils import timezone
+from django.utils.http import quote_etag
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.conf import settings
+from django.db import transaction
 from django.db.models import Avg, Count, Q
 
-from .models import AudioRecording, AnalysisResult
-from .tasks import process_audio_recording
+from .blobs import acquire_existing, acquire_upload
+from .models import AudioBlob, AudioRecording, AnalysisResult, build_audio_path
+from .queues import admission
+from .tasks import submit_analysis
+from core.http_range import RangeNotSatisfiable, parse_range_header
+from core.rate_limit import upload_bucket
 from core.models import Patient
 
+import hashlib
+import json
 import logging
+import mimetypes
 import os
+import uuid
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_TICKET_SALT = 'diagnosis.views.upload_ticket'
+
+
+def _validate_audio_upload(filename, size):
+    """Return an error message if the upload breaks size/format rules, else None"""
+    if size > settings.MAX_UPLOAD_SIZE:
+        max_size_mb = settings.MAX_UPLOAD_SIZE / (1024*1024)
+        return f'File too large. Max size: {max_size_mb}MB'
+
+    file_ext = os.path.splitext(filename or '')[1].lower()
+    if file_ext not in settings.ALLOWED_AUDIO_FORMATS:
+        return f'Invalid file format. Allowed: {", ".join(settings.ALLOWED_AUDIO_FORMATS)}'
+
+    return None
+
+
+def _upload_rate_limited(request):
+    """
+    Spend one token from the user's upload bucket. Returns a 429 response when
+    the bucket is empty. Rejecting is only cheap for the small JSON sign
+    request; a multipart upload has already been read in full by the CSRF
+    middleware, so the limit there only spares storage and analysis.
+    """
+    allowed, retry_after = upload_bucket().take(request.user.pk)
+    if allowed:
+        return None
+    response = JsonResponse({
+        'error': f'Too many uploads, please try again in {retry_after} seconds',
+        'retry_after': retry_after,
+    }, status=429)
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def _upload_accepted(recording):
+    """
+    Upload response with a queued-ETA estimate. Under backpressure the upload
+    is still accepted, but as 202 so the client knows analysis will be late.
+    """
+    queue = admission(recording)
+    if queue['congested']:
+        message = 'Audio uploaded successfully. Analysis is queued behind other work.'
+    else:
+        message = 'Audio uploaded successfully. Processing started.'
+    return JsonResponse({
+        'success': True,
+        'recording_id': recording.id,
+        'message': message,
+        'queue': queue,
+    }, status=202 if queue['congested'] else 201)
+
+
+def _request_patient_id(request):
+    """Patient id of the logged-in user, or None when there is no profile"""
+    try:
+        return request.user.patient_profile.id
+    except Patient.DoesNotExist:
+        return None
+
+
+def _build_etag(request, *parts):
+    """
+    Strong ETag over the given parts plus the CSRF secret, so a cached page
+    never carries a form token from a previous session.
+    """
+    get_token(request)  # make sure the secret exists before it is hashed
+    parts = parts + (request.META.get('CSRF_COOKIE', ''),)
+    digest = hashlib.sha256('|'.join(str(p) for p in parts).encode()).hexdigest()
+    return quote_etag(digest[:32])
+
+
+def _recording_state(request, recording_id):
+    """Fields the recording page depends on, fetched once per request"""
+    cache_attr = f'_recording_state_{recording_id}'
+    if not hasattr(request, cache_attr):
+        patient_id = _request_patient_id(request)
+        row = None
+        if patient_id is not None:
+            row = (
+                AudioRecording.objects
+                .filter(id=recording_id, patient_id=patient_id)
+                .values_list(
+                    'status', 'processed_at', 'duration_seconds', 'analysis__id', 'spectrogram_image',
+                    'file_size_bytes', 'archive_format', 'archived_at',
+                )
+                .first()
+            )
+        setattr(request, cache_attr, row)
+    return getattr(request, cache_attr)
+
+
+def _recording_etag(request, recording_id):
+    row = _recording_state(request, recording_id)
+    if row is None:
+        return None
+    return _build_etag(request, 'recording', recording_id, *row)
+
+
+def _recording_last_modified(request, recording_id):
+    # Only completed recordings with their visuals are final; others rely on the ETag alone
+    row = _recording_state(request, recording_id)
+    if row is None or row[0] != 'completed' or not row[4]:
+        return None
+    # Archiving swaps the audio (and its size) after completion
+    return max(filter(None, (row[1], row[7])), default=None)
+
+
+def _analysis_state(request, analysis_id):
+    """created_at of the analysis (it never changes afterwards) and the recording's visuals"""
+    cache_attr = f'_analysis_state_{analysis_id}'
+    if not hasattr(request, cache_attr):
+        patient_id = _request_patient_id(request)
+        row = None
+        if patient_id is not None:
+            row = (
+                AnalysisResult.objects
+                .filter(id=analysis_id, recording__patient_id=patient_id)
+                .values_list('created_at', 'recording__spectrogram_image')
+                .first()
+            )
+        setattr(request, cache_attr, row)
+    return getattr(request, cache_attr)
+
+
+def _analysis_etag(request, analysis_id):
+    row = _analysis_state(request, analysis_id)
+    if row is None:
+        return None
+    return _build_etag(request, 'analysis', analysis_id, row[0].isoformat(), row[1])
+
+
+def _analysis_last_modified(request, analysis_id):
+    row = _analysis_state(request, analysis_id)
+    if row is None or not row[1]:
+        return None
+    return row[0]
+
+
+def _timeline_context(recording, analysis):
+    """Data the stutter timeline needs: precomputed peaks plus the stutter spans"""
+    if not recording.waveform_peaks:
+        return None
+    return {
+        'peaks': recording.waveform_peaks,
+        'stutter_timestamps': analysis.stutter_timestamps if analysis else [],
+    }
+
 
 @login_required
 def record_audio(request):
@@ -31,6 +193,9 @@ def upload_recording(request):
     """Handle audio file upload"""
     if request.method != 'POST':
         return JsonResponse({'error': 'POST method required'}, status=405)
+    limited = _upload_rate_limited(request)
+    if limited:
+        return limited
 
     try:
         patient = request.user.patient_profile
@@ -38,38 +203,186 @@ def upload_recording(request):
         if not audio_file:
             return JsonResponse({'error': 'No audio file provided'}, status=400)
 
-        if audio_file.size > settings.MAX_UPLOAD_SIZE:
-            max_size_mb = settings.MAX_UPLOAD_SIZE / (1024*1024)
-            return JsonResponse({'error': f'File too large. Max size: {max_size_mb}MB'}, status=400)
-
-        file_ext = os.path.splitext(audio_file.name)[1].lower()
-        if file_ext not in settings.ALLOWED_AUDIO_FORMATS:
-            return JsonResponse({'error': f'Invalid file format. Allowed: {", ".join(settings.ALLOWED_AUDIO_FORMATS)}'}, status=400)
+        error = _validate_audio_upload(audio_file.name, audio_file.size)
+        if error:
+            return JsonResponse({'error': error}, status=400)
 
         # Log storage type for debugging
         field = AudioRecording._meta.get_field('audio_file')
         logger.info(f"AudioRecording.audio_file storage type: {type(field.storage)}, value: {field.storage}")
 
+        # Content-addressed: identical audio is stored once and only referenced again
+        with transaction.atomic():
+            blob = acquire_upload(audio_file)
+            recording = AudioRecording.objects.create(
+                patient=patient,
+                audio_file=blob.path,
+                blob=blob,
+                file_size_bytes=audio_file.size,
+                status='pending'
+            )
+
+        logger.info(f"Recording {recording.id} uploaded by {patient.user.username}")
+        submit_analysis(recording)
+
+        return _upload_accepted(recording)
+
+    except Patient.DoesNotExist:
+        return JsonResponse({'error': 'Patient profile not found'}, status=404)
+    except Exception as e:
+        logger.error(f"Upload failed: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+@login_required
+def create_upload_url(request):
+    """
+    Step 1 of a direct upload: hand the browser a short-lived signed URL so the
+    audio goes straight to storage instead of through the web workers.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST method required'}, status=405)
+    limited = _upload_rate_limited(request)
+    if limited:
+        return limited
+
+    try:
+        patient = request.user.patient_profile
+        payload = json.loads(request.body or b'{}')
+        filename = os.path.basename(payload.get('filename') or '')
+        size = int(payload.get('size') or 0)
+
+        if not filename or size <= 0:
+            return JsonResponse({'error': 'filename and size are required'}, status=400)
+
+        error = _validate_audio_upload(filename, size)
+        if error:
+            return JsonResponse({'error': error}, status=400)
+
+        # The browser sends the SHA-256 of the file; if this patient already
+        # uploaded the same audio there is nothing to transfer
+        sha256 = (payload.get('sha256') or '').lower()
+        if sha256:
+            blob = AudioBlob.objects.filter(sha256=sha256, recordings__patient=patient).first()
+            if blob is not None:
+                ticket = signing.dumps(
+                    {'blob_id': blob.id, 'patient_id': patient.id, 'upload_id': uuid.uuid4().hex},
+                    salt=UPLOAD_TICKET_SALT,
+                )
+                return JsonResponse({'duplicate': True, 'ticket': ticket}, status=201)
+
+        storage = AudioRecording._meta.get_field('audio_file').storage
+        name = build_audio_path(patient.id, f'{uuid.uuid4().hex[:12]}_{storage.get_valid_name(filename)}')
+        upload = storage.create_signed_upload(name)
+        ticket = signing.dumps({'path': name, 'patient_id': patient.id}, salt=UPLOAD_TICKET_SALT)
+
+        return JsonResponse({'upload': upload, 'ticket': ticket}, status=201)
+
+    except Patient.DoesNotExist:
+        return JsonResponse({'error': 'Patient profile not found'}, status=404)
+    except (ValueError, TypeError):
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
+    except Exception as e:
+        logger.error(f"Signed upload URL failed: {e}")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def _ticket_recording(cache_key, patient):
+    """The recording an upload ticket was already finalized into, if any"""
+    recording_id = cache.get(cache_key)
+    if recording_id:
+        return AudioRecording.objects.filter(id=recording_id, patient=patient).first()
+    return None
+
+
+def _finalize_duplicate_upload(patient, ticket):
+    """Create the recording for content the patient already stored, once per ticket"""
+    cache_key = f"upload_ticket:{ticket['upload_id']}"
+    recording = _ticket_recording(cache_key, patient)
+    if recording is not None:
+        return recording
+
+    with transaction.atomic():
+        blob = acquire_existing(ticket['blob_id'])
         recording = AudioRecording.objects.create(
             patient=patient,
-            audio_file=audio_file,
-            file_size_bytes=audio_file.size,
+            audio_file=blob.path,
+            blob=blob,
+            file_size_bytes=blob.size_bytes,
             status='pending'
         )
+    cache.set(cache_key, recording.id, settings.DIRECT_UPLOAD_URL_EXPIRES_IN)
+
+    logger.info(f"Recording {recording.id} created from existing audio by {patient.user.username} (no transfer)")
+    submit_analysis(recording)
+    return recording
 
-        logger.info(f"Recording {recording.id} uploaded by {patient.user.username}")
-        process_audio_recording.delay(recording.id)
 
-        return JsonResponse({
-            'success': True,
-            'recording_id': recording.id,
-            'message': 'Audio uploaded successfully. Processing started.'
-        }, status=201)
+@login_required
+def finalize_upload(request):
+    """
+    Step 2 of a direct upload: the file is already in storage, so just record
+    it and queue the analysis. Finalizing the same ticket twice is harmless.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST method required'}, status=405)
+
+    try:
+        patient = request.user.patient_profile
+        payload = json.loads(request.body or b'{}')
+        ticket = signing.loads(
+            payload.get('ticket') or '',
+            salt=UPLOAD_TICKET_SALT,
+            max_age=settings.DIRECT_UPLOAD_URL_EXPIRES_IN,
+        )
+        if ticket['patient_id'] != patient.id:
+            return JsonResponse({'error': 'Upload ticket does not belong to this patient'}, status=403)
+
+        if 'blob_id' in ticket:
+            recording = _finalize_duplicate_upload(patient, ticket)
+            return _upload_accepted(recording)
+
+        # Keyed on the ticket, not audio_file: once the worker dedupes the
+        # upload into an existing blob, the path no longer points at it
+        path = ticket['path']
+        cache_key = f"upload_ticket:path:{path}"
+        recording = (
+            _ticket_recording(cache_key, patient)
+            or AudioRecording.objects.filter(patient=patient, audio_file=path).first()
+        )
+        if recording is None:
+            storage = AudioRecording._meta.get_field('audio_file').storage
+            if not storage.exists(path):
+                return JsonResponse({'error': 'Uploaded file not found in storage'}, status=400)
+
+            size = storage.size(path)
+            error = _validate_audio_upload(path, size)
+            if error:
+                storage.delete(path)
+                return JsonResponse({'error': error}, status=400)
+
+            recording = AudioRecording.objects.create(
+                patient=patient,
+                audio_file=path,
+                file_size_bytes=size,
+                status='pending'
+            )
+            cache.set(cache_key, recording.id, settings.DIRECT_UPLOAD_URL_EXPIRES_IN)
+            logger.info(f"Recording {recording.id} uploaded directly to storage by {patient.user.username}")
+            submit_analysis(recording)
+
+        return _upload_accepted(recording)
 
     except Patient.DoesNotExist:
         return JsonResponse({'error': 'Patient profile not found'}, status=404)
+    except signing.BadSignature:
+        return JsonResponse({'error': 'Upload ticket is invalid or expired'}, status=400)
+    except AudioBlob.DoesNotExist:
+        return JsonResponse({'error': 'Stored audio no longer exists, please upload again'}, status=409)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid request body'}, status=400)
     except Exception as e:
-        logger.error(f"Upload failed: {e}")
+        logger.error(f"Finalize upload failed: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
 
@@ -108,21 +421,24 @@ def recordings_list(request):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=_recording_etag, last_modified_func=_recording_last_modified)
 def recording_detail(request, recording_id):
     """Display single recording details"""
     try:
         patient = request.user.patient_profile
-        recording = get_object_or_404(AudioRecording, id=recording_id, patient=patient)
-        analysis = None
-        if recording.status == 'completed':
-            try:
-                analysis = recording.analysis
-            except AnalysisResult.DoesNotExist:
-                pass
+        recording = get_object_or_404(
+            AudioRecording.objects.select_related('analysis'),
+            id=recording_id,
+            patient=patient,
+        )
+        analysis = recording.analysis if recording.status == 'completed' else None
         
         context = {
             'recording': recording,
             'analysis': analysis,
+            'timeline': _timeline_context(recording, analysis),
+            'cache_timeout': settings.ANALYSIS_PAGE_CACHE_TIMEOUT,
         }
         
         return render(request, 'diagnosis/recording_detail.html', context)
@@ -133,15 +449,96 @@ def recording_detail(request, recording_id):
 
 
 @login_required
+def stream_audio(request, recording_id):
+    """
+    Authenticated audio playback with HTTP Range support, so seeking in a long
+    recording only transfers the bytes that are actually played.
+    """
+    try:
+        patient = request.user.patient_profile
+    except Patient.DoesNotExist:
+        return JsonResponse({'error': 'Patient profile not found'}, status=404)
+
+    recording = get_object_or_404(AudioRecording, id=recording_id, patient=patient)
+    if not recording.audio_file:
+        return JsonResponse({'error': 'Recording has no audio'}, status=404)
+
+    storage = recording.audio_file.storage
+    name = recording.audio_file.name
+    try:
+        size = storage.size(name)
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Audio file not found'}, status=404)
+
+    # Archiving replaces the object behind this URL, so cached ranges are tied
+    # to the exact file: a stale If-Range gets the whole new file, not a splice
+    etag = quote_etag(hashlib.sha256(f'{name}|{size}'.encode()).hexdigest()[:32])
+    if_range = request.META.get('HTTP_IF_RANGE')
+    range_header = request.META.get('HTTP_RANGE') if if_range in (None, etag) else None
+    if range_header is None and request.META.get('HTTP_IF_NONE_MATCH') == etag:
+        response = HttpResponse(status=304)
+        response['ETag'] = etag
+        return response
+
+    try:
+        byte_range = parse_range_header(range_header, size)
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    start, end = byte_range or (0, size - 1)
+    response = StreamingHttpResponse(
+        storage.stream_range(name, start, end),
+        status=206 if byte_range else 200,
+        content_type=mimetypes.guess_type(name)[0] or 'application/octet-stream',
+    )
+    response['Content-Length'] = str(end - start + 1)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    if byte_range:
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if request.GET.get('download'):
+        response['Content-Disposition'] = f'attachment; filename="{recording.filename}"'
+    return response
+
+
+@login_required
+def recording_spectrogram(request, recording_id):
+    """Serve the precomputed spectrogram thumbnail (works with private buckets)"""
+    try:
+        patient = request.user.patient_profile
+    except Patient.DoesNotExist:
+        return JsonResponse({'error': 'Patient profile not found'}, status=404)
+
+    recording = get_object_or_404(AudioRecording, id=recording_id, patient=patient)
+    if not recording.spectrogram_image:
+        return JsonResponse({'error': 'Spectrogram not generated yet'}, status=404)
+
+    response = FileResponse(recording.spectrogram_image.open('rb'), content_type='image/png')
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+@login_required
+@cache_control(private=True, max_age=settings.ANALYSIS_PAGE_MAX_AGE)
+@condition(etag_func=_analysis_etag, last_modified_func=_analysis_last_modified)
 def analysis_detail(request, analysis_id):
     """Display analysis results with detailed metrics"""
     try:
         patient = request.user.patient_profile
-        analysis = get_object_or_404(AnalysisResult, id=analysis_id, recording__patient=patient)
+        analysis = get_object_or_404(
+            AnalysisResult.objects.select_related('recording'),
+            id=analysis_id,
+            recording__patient=patient,
+        )
         
         context = {
             'analysis': analysis,
             'recording': analysis.recording,
+            'timeline': _timeline_context(analysis.recording, analysis),
+            'cache_timeout': settings.ANALYSIS_PAGE_CACHE_TIMEOUT,
         }
         
         return render(request, 'diagnosis/analysis_detail.html', context)
@@ -161,9 +558,7 @@ def delete_recording(request, recording_id):
         patient = request.user.patient_profile
         recording = get_object_or_404(AudioRecording, id=recording_id, patient=patient)
         
-        if recording.audio_file:
-            recording.audio_file.delete()
-        
+        # AudioRecording.delete() removes the stored audio (shared blobs only with their last reference)
         recording.delete()
         messages.success(request, 'Recording deleted successfully')
         
@@ -189,16 +584,13 @@ def check_status(request, recording_id):
             'error_message': recording.error_message,
         }
         
-        if recording.status == 'completed':
-            try:
-                analysis = recording.analysis
-                response_data.update({
-                    'analysis_id': analysis.id,
-                    'severity': analysis.severity,
-                    'mismatch_percentage': float(analysis.mismatch_percentage),
-                })
-            except AnalysisResult.DoesNotExist:
-                pass
+        analysis = recording.analysis if recording.status == 'completed' else None
+        if analysis:
+            response_data.update({
+                'analysis_id': analysis.id,
+                'severity': analysis.severity,
+                'mismatch_percentage': float(analysis.mismatch_percentage),
+            })
         
         return JsonResponse(response_data)
         
@@ -0,0 +1,152 @@
+# reports/engine.py
+"""
+Report generation for many patients at once.
+
+The current analyses of a whole chunk of patients are read in one query and
+turned into NumPy columns. Per-patient statistics come from grouped
+reductions over those columns (np.add.reduceat / np.add.at), not a Python
+loop per analysis, so a nightly run over thousands of patients is a handful
+of queries and array operations per chunk.
+"""
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from diagnosis.models import AnalysisResult, AudioRecording
+from .models import Report
+
+SEVERITIES = [code for code, _ in AnalysisResult.SEVERITY_CHOICES]
+PERIOD_DAYS = {'weekly': 7, 'monthly': 30}
+PERCENTILES = (10, 50, 90)
+
+RECOMMENDATIONS = {
+    'none': "Keep up regular practice to maintain fluency.",
+    'mild': "Continue daily reading exercises, focusing on easy onsets.",
+    'moderate': "Practise slow, prolonged speech for 15 minutes a day and review progress with your therapist.",
+    'severe': "Schedule a session with your therapist to adjust the treatment plan.",
+}
+
+
+def period_bounds(report_type, end=None):
+    """(start, end) of the window a report covers"""
+    end = end or timezone.now()
+    return end - timedelta(days=PERIOD_DAYS.get(report_type, 0)), end
+
+
+def load_columns(patient_ids, start, end):
+    """Current analyses of the patients in [start, end), as NumPy columns sorted by patient and time"""
+    rows = list(
+        AudioRecording.objects
+        .filter(
+            patient_id__in=patient_ids, status='completed', analysis__isnull=False,
+            recorded_at__gte=start, recorded_at__lt=end,
+        )
+        .order_by('patient_id', 'recorded_at')
+        .values_list(
+            'patient_id', 'analysis_id', 'recorded_at', 'analysis__severity',
+            'analysis__mismatch_percentage', 'analysis__stutter_frequency', 'analysis__ctc_loss_score',
+        )
+    )
+    if not rows:
+        return None
+    patient, analysis, recorded_at, severity, mismatch, frequency, ctc_loss = zip(*rows)
+    return {
+        'patient': np.array(patient),
+        'analysis': np.array(analysis),
+        'days': np.array([ts.timestamp() for ts in recorded_at]) / 86400.0,
+        'severity': np.array([SEVERITIES.index(s) for s in severity]),
+        'mismatch': np.array(mismatch, dtype=float),
+        'frequency': np.array(frequency, dtype=float),
+        'ctc_loss': np.array(ctc_loss, dtype=float),
+    }
+
+
+def summarize(columns):
+    """Per-patient statistics as {patient_id: (key_findings, progress_metrics, analysis_ids)}"""
+    patients, starts, counts = np.unique(columns['patient'], return_index=True, return_counts=True)
+    group = np.repeat(np.arange(len(patients)), counts)
+
+    # Severity histogram per patient
+    histogram = np.zeros((len(patients), len(SEVERITIES)), dtype=int)
+    np.add.at(histogram, (group, columns['severity']), 1)
+
+    # Least-squares slope of mismatch % per day, from grouped sums; time is
+    # measured from each patient's first analysis to keep the sums small
+    x = columns['days'] - columns['days'][starts][group]
+    y = columns['mismatch']
+    sx, sy = np.add.reduceat(x, starts), np.add.reduceat(y, starts)
+    sxx, sxy = np.add.reduceat(x * x, starts), np.add.reduceat(x * y, starts)
+    denominator = counts * sxx - sx * sx
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(denominator > 0, (counts * sxy - sx * sy) / denominator, 0.0)
+
+    mean_mismatch = sy / counts
+    mean_ctc_loss = np.add.reduceat(columns['ctc_loss'], starts) / counts
+    frequency_groups = np.split(columns['frequency'], starts[1:])
+    analysis_groups = np.split(columns['analysis'], starts[1:])
+
+    results = {}
+    for i, patient_id in enumerate(patients.tolist()):
+        percentiles = np.percentile(frequency_groups[i], PERCENTILES)
+        key_findings = {
+            'analysis_count': int(counts[i]),
+            'severity_histogram': dict(zip(SEVERITIES, histogram[i].tolist())),
+            # Ties go to the more severe level
+            'dominant_severity': SEVERITIES[len(SEVERITIES) - 1 - int(np.argmax(histogram[i][::-1]))],
+            'trend': 'improving' if slope[i] < 0 else 'declining' if slope[i] > 0 else 'stable',
+        }
+        progress_metrics = {
+            'mismatch_slope_per_day': round(float(slope[i]), 4),
+            'mean_mismatch_percentage': round(float(mean_mismatch[i]), 2),
+            'mean_ctc_loss': round(float(mean_ctc_loss[i]), 4),
+            'stutter_frequency_percentiles': {
+                f'p{p}': round(float(value), 2) for p, value in zip(PERCENTILES, percentiles)
+            },
+        }
+        results[patient_id] = (key_findings, progress_metrics, analysis_groups[i].tolist())
+    return results
+
+
+def _summary_text(report_type, key_findings, progress_metrics):
+    return (
+        f"{dict(Report.REPORT_TYPES)[report_type]} covering {key_findings['analysis_count']} recording(s). "
+        f"Average mismatch was {progress_metrics['mean_mismatch_percentage']:.1f}% and the trend is "
+        f"{key_findings['trend']} ({progress_metrics['mismatch_slope_per_day']:+.2f} points per day)."
+    )
+
+
+def generate_reports(patient_ids, report_type, start, end):
+    """
+    Create one report per patient with analyses in the window, attaching the
+    analyses with a single bulk insert. Returns the created reports.
+    """
+    columns = load_columns(patient_ids, start, end)
+    if columns is None:
+        return []
+    stats = summarize(columns)
+
+    reports = []
+    attached = []
+    for patient_id, (key_findings, progress_metrics, analysis_ids) in stats.items():
+        progress_metrics = {**progress_metrics, 'period_start': start.isoformat(), 'period_end': end.isoformat()}
+        reports.append(Report(
+            patient_id=patient_id,
+            report_type=report_type,
+            summary=_summary_text(report_type, key_findings, progress_metrics),
+            key_findings=key_findings,
+            progress_metrics=progress_metrics,
+            recommendations=RECOMMENDATIONS[key_findings['dominant_severity']],
+        ))
+        attached.append(analysis_ids)
+
+    Through = Report.analyses.through
+    with transaction.atomic():
+        Report.objects.bulk_create(reports)
+        Through.objects.bulk_create([
+            Through(report_id=report.id, analysisresult_id=analysis_id)
+            for report, analysis_ids in zip(reports, attached)
+            for analysis_id in analysis_ids
+        ])
+    return reports
@@ -0,0 +1,203 @@
+# reports/export.py
+"""
+Streaming exports of analyses and daily progress for therapists and research.
+
+Rows are read with server-side cursors (QuerySet.iterator) and written out
+chunk by chunk, so memory stays flat however large the cohort is. CSV is
+always available; Parquet needs the optional pyarrow package. Each
+analysis's stutter_timestamps are flattened into one row per stutter event
+(analyses without any still get one row, with empty event columns).
+"""
+import csv
+import io
+
+from django.conf import settings
+from django.db.models import F
+
+from diagnosis.models import AnalysisResult
+from .models import ProgressTracking
+
+FORMATS = ('csv', 'parquet')
+
+ANALYSIS_COLUMNS = [
+    ('analysis_id', 'int64'),
+    ('recording_id', 'int64'),
+    ('patient_id', 'int64'),
+    ('recorded_at', 'timestamp'),
+    ('model_version', 'string'),
+    ('severity', 'string'),
+    ('mismatch_percentage', 'float64'),
+    ('ctc_loss_score', 'float64'),
+    ('stutter_frequency', 'float64'),
+    ('total_stutter_duration', 'float64'),
+    ('confidence_score', 'float64'),
+    ('duration_seconds', 'float64'),
+    ('stutter_index', 'int64'),
+    ('stutter_start', 'float64'),
+    ('stutter_end', 'float64'),
+]
+
+PROGRESS_COLUMNS = [
+    ('patient_id', 'int64'),
+    ('recorded_date', 'date'),
+    ('analysis_count', 'int64'),
+    ('avg_mismatch_percentage', 'float64'),
+    ('avg_ctc_loss', 'float64'),
+    ('avg_stutter_frequency', 'float64'),
+    ('total_practice_minutes', 'int64'),
+    ('improvement_score', 'float64'),
+]
+
+
+class MissingDependency(Exception):
+    pass
+
+
+def analysis_queryset(patient_ids=None, since=None, until=None, all_versions=False):
+    """Analyses of a cohort; only each recording's current one unless all_versions"""
+    analyses = AnalysisResult.objects.all()
+    if not all_versions:
+        analyses = analyses.filter(recording__analysis=F('id'))
+    if patient_ids:
+        analyses = analyses.filter(recording__patient_id__in=patient_ids)
+    if since:
+        analyses = analyses.filter(recording__recorded_at__gte=since)
+    if until:
+        analyses = analyses.filter(recording__recorded_at__lt=until)
+    return analyses.order_by('recording__patient_id', 'recording__recorded_at', 'id')
+
+
+def progress_queryset(patient_ids=None, since=None, until=None):
+    progress = ProgressTracking.objects.all()
+    if patient_ids:
+        progress = progress.filter(patient_id__in=patient_ids)
+    if since:
+        progress = progress.filter(recorded_date__gte=since)
+    if until:
+        progress = progress.filter(recorded_date__lt=until)
+    return progress.order_by('patient_id', 'recorded_date')
+
+
+def _span(span):
+    """(start, end) of a stutter event stored as [start, end] or {'start', 'end'}"""
+    if isinstance(span, dict):
+        return span.get('start'), span.get('end')
+    return span[0], span[1]
+
+
+def analysis_rows(queryset):
+    """Flattened analysis rows, one per stutter event, streamed from a server-side cursor"""
+    rows = queryset.values_list(
+        'id', 'recording_id', 'recording__patient_id', 'recording__recorded_at', 'model_version', 'severity',
+        'mismatch_percentage', 'ctc_loss_score', 'stutter_frequency', 'total_stutter_duration',
+        'confidence_score', 'recording__duration_seconds', 'stutter_timestamps',
+    )
+    for *fields, timestamps in rows.iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+        if not timestamps:
+            yield (*fields, None, None, None)
+        for index, span in enumerate(timestamps or []):
+            yield (*fields, index, *_span(span))
+
+
+def progress_rows(queryset):
+    names = [name for name, _ in PROGRESS_COLUMNS]
+    return queryset.values_list(*names).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE)
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def stream_csv(columns, rows):
+    """CSV bytes, one piece per chunk of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for chunk in _chunks(rows, settings.EXPORT_CHUNK_SIZE):
+        writer.writerows(['' if value is None else value for value in row] for row in chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain()"""
+
+    def __init__(self):
+        self.pieces = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.pieces.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.pieces)
+        self.pieces = []
+        return data
+
+
+def _arrow_schema(pa, columns):
+    types = {
+        'int64': pa.int64(),
+        'float64': pa.float64(),
+        'string': pa.string(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'date': pa.date32(),
+    }
+    return pa.schema([(name, types[kind]) for name, kind in columns])
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise MissingDependency("Parquet export needs pyarrow (pip install pyarrow)")
+    return pa, pq
+
+
+def stream_parquet(columns, rows, pa, pq):
+    """Parquet bytes, one row group per chunk of rows"""
+    schema = _arrow_schema(pa, columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+    for chunk in _chunks(rows, settings.EXPORT_CHUNK_SIZE):
+        arrays = [
+            pa.array([row[i] for row in chunk], type=field.type)
+            for i, field in enumerate(schema)
+        ]
+        writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(dataset, export_format, patient_ids=None, since=None, until=None, all_versions=False):
+    """
+    Byte chunks of a whole export; dataset is 'analyses' or 'progress'.
+    Raises MissingDependency up front (not mid-stream) when Parquet can't be written.
+    """
+    if dataset == 'progress':
+        columns, rows = PROGRESS_COLUMNS, progress_rows(progress_queryset(patient_ids, since, until))
+    else:
+        columns, rows = ANALYSIS_COLUMNS, analysis_rows(analysis_queryset(patient_ids, since, until, all_versions))
+    if export_format == 'parquet':
+        return stream_parquet(columns, rows, *_import_pyarrow())
+    return stream_csv(columns, rows)
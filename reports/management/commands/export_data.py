@@ -0,0 +1,50 @@
+# reports/management/commands/export_data.py
+"""
+Export analyses or daily progress to a CSV or Parquet file, streamed in
+chunks from server-side cursors so memory stays flat for any cohort size.
+
+Usage:
+    python manage.py export_data analyses.csv
+    python manage.py export_data analyses.parquet --format parquet --patient 12 --patient 15
+    python manage.py export_data progress.csv --dataset progress --since 2024-01-01
+    python manage.py export_data all_versions.csv --all-versions
+"""
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reports.export import FORMATS, MissingDependency, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream analyses or progress to a CSV/Parquet file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="File to write")
+        parser.add_argument('--dataset', choices=['analyses', 'progress'], default='analyses')
+        parser.add_argument('--format', choices=FORMATS, default='csv', dest='export_format')
+        parser.add_argument('--patient', type=int, action='append', dest='patient_ids', help="Patient id (repeatable)")
+        parser.add_argument('--since', type=date.fromisoformat, help="YYYY-MM-DD, inclusive")
+        parser.add_argument('--until', type=date.fromisoformat, help="YYYY-MM-DD, exclusive")
+        parser.add_argument('--all-versions', action='store_true', help="Every model version, not just current results")
+
+    def handle(self, *args, output, dataset='analyses', export_format='csv', patient_ids=None,
+               since=None, until=None, all_versions=False, **options):
+        try:
+            chunks = stream_export(
+                dataset, export_format, patient_ids=patient_ids, since=since, until=until, all_versions=all_versions,
+            )
+        except MissingDependency as e:
+            raise CommandError(str(e))
+
+        started = time.monotonic()
+        written = 0
+        with open(output, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {written / 1024 / 1024:.1f} MB of {dataset} to {output} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,64 @@
+# reports/management/commands/render_report_pdfs.py
+"""
+Render report PDFs in bulk with a local process pool, e.g. after a
+template change. Reports whose inputs are unchanged are skipped, so
+re-running is cheap.
+
+Report data and HTML are prepared in this process; only the HTML -> PDF
+conversion runs in the pool, which needs no database access.
+
+Usage:
+    python manage.py render_report_pdfs                  # every stale or missing PDF
+    python manage.py render_report_pdfs --patient 12
+    python manage.py render_report_pdfs --workers 8 --chunk-size 100
+"""
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from reports.models import Report
+from reports.pdf import content_hash, html_to_pdf, needs_render, render_html, report_context, store_pdf
+
+
+class Command(BaseCommand):
+    help = "Render missing or stale report PDFs in parallel"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', dest='patient_ids', help="Patient id (repeatable)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+        parser.add_argument('--chunk-size', type=int, default=50)
+
+    def handle(self, *args, patient_ids=None, workers=None, chunk_size=50, **options):
+        reports = Report.objects.select_related('patient__user')
+        if patient_ids:
+            reports = reports.filter(patient_id__in=patient_ids)
+
+        started = time.monotonic()
+        rendered = skipped = 0
+        last_id = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            while True:
+                chunk = list(reports.filter(id__gt=last_id).order_by('id')[:chunk_size])
+                if not chunk:
+                    break
+                last_id = chunk[-1].id
+
+                stale = []
+                for report in chunk:
+                    context = report_context(report)
+                    digest = content_hash(context)
+                    if needs_render(report, digest):
+                        stale.append((report, digest, render_html(context)))
+                skipped += len(chunk) - len(stale)
+
+                pdfs = pool.map(html_to_pdf, [html for _, _, html in stale])
+                for (report, digest, _), pdf_bytes in zip(stale, pdfs):
+                    store_pdf(report, pdf_bytes, digest)
+                rendered += len(stale)
+                self.stdout.write(f"Rendered {rendered}, unchanged {skipped} (up to report {last_id})")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} PDFs, skipped {skipped} unchanged in {time.monotonic() - started:.1f}s"
+        ))
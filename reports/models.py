@@ -26,6 +26,7 @@ class Report(models.Model):
     # Metadata
     generated_at = models.DateTimeField(auto_now_add=True)
     pdf_file = models.FileField(upload_to='reports/%Y/%m/', blank=True, null=True)
+    pdf_content_hash = models.CharField(max_length=64, blank=True, help_text="sha256 of the inputs pdf_file was rendered from")
     shared_with_therapist = models.BooleanField(default=False)
     therapist_notes = models.TextField(blank=True)
     
@@ -80,10 +81,23 @@ class ProgressTracking(models.Model):
     avg_ctc_loss = models.FloatField()
     avg_stutter_frequency = models.FloatField()
     total_practice_minutes = models.IntegerField(default=0)
+
+    # Running totals behind the averages (see reports/progress.py)
+    analysis_count = models.PositiveIntegerField(default=0)
+    mismatch_percentage_sum = models.FloatField(default=0.0)
+    ctc_loss_sum = models.FloatField(default=0.0)
+    stutter_frequency_sum = models.FloatField(default=0.0)
+    practice_seconds = models.FloatField(default=0.0)
     
     # Improvement Indicators
+    baseline_mismatch_percentage = models.FloatField(
+        null=True,
+        blank=True,
+        help_text="Average mismatch on the patient's previous tracked day"
+    )
     improvement_score = models.FloatField(
         validators=[MinValueValidator(-100.0), MaxValueValidator(100.0)],
+        default=0.0,
         help_text="Positive = improvement, Negative = decline"
     )
     
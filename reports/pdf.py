@@ -0,0 +1,101 @@
+# reports/pdf.py
+"""
+PDF rendering for reports.
+
+Rendering happens in the background (see reports/tasks.py and the
+render_report_pdfs command), never in a request. The inputs of a PDF, the
+report data plus the template itself, are hashed, so an unchanged report is
+never rendered twice. The HTML -> PDF step is a pure function of the HTML,
+which lets it run in worker processes without Django.
+"""
+import hashlib
+import io
+import json
+import logging
+
+from django.core.files.base import ContentFile
+from django.template.loader import get_template, render_to_string
+
+from .models import Report
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_NAME = 'pdf_report.html'
+
+
+def report_context(report):
+    """Everything the PDF shows; also the input to content_hash()"""
+    analyses = (
+        report.analyses
+        .order_by('recording__recorded_at')
+        .values_list('id', 'recording__recorded_at', 'severity', 'mismatch_percentage', 'stutter_frequency')
+    )
+    return {
+        'report_id': report.id,
+        'report_type': report.get_report_type_display(),
+        'patient_name': report.patient.user.get_full_name() or report.patient.user.username,
+        'generated_at': report.generated_at.isoformat(),
+        'summary': report.summary,
+        'key_findings': report.key_findings,
+        'progress_metrics': report.progress_metrics,
+        'recommendations': report.recommendations,
+        'therapist_notes': report.therapist_notes,
+        'analyses': [
+            {
+                'id': analysis_id,
+                'recorded_at': recorded_at.isoformat(),
+                'severity': severity,
+                'mismatch_percentage': round(mismatch, 1),
+                'stutter_frequency': round(frequency, 1),
+            }
+            for analysis_id, recorded_at, severity, mismatch, frequency in analyses
+        ],
+    }
+
+
+def content_hash(context):
+    """sha256 of the report data and the template source"""
+    digest = hashlib.sha256(json.dumps(context, sort_keys=True, default=str).encode())
+    with open(get_template(TEMPLATE_NAME).origin.name, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def render_html(context):
+    return render_to_string(TEMPLATE_NAME, context)
+
+
+def html_to_pdf(html):
+    """PDF bytes for an HTML document; safe to call from a worker process"""
+    from xhtml2pdf import pisa
+
+    output = io.BytesIO()
+    result = pisa.CreatePDF(html, dest=output, encoding='utf-8')
+    if result.err:
+        raise ValueError(f"PDF rendering failed with {result.err} error(s)")
+    return output.getvalue()
+
+
+def needs_render(report, digest):
+    return not report.pdf_file or report.pdf_content_hash != digest
+
+
+def store_pdf(report, pdf_bytes, digest):
+    """Save the PDF through the configured storage and drop the previous one"""
+    old_name = report.pdf_file.name if report.pdf_file else None
+    report.pdf_file.save(f'report-{report.id}.pdf', ContentFile(pdf_bytes), save=False)
+    Report.objects.filter(pk=report.pk).update(pdf_file=report.pdf_file.name, pdf_content_hash=digest)
+    report.pdf_content_hash = digest
+    if old_name and old_name != report.pdf_file.name:
+        report.pdf_file.storage.delete(old_name)
+
+
+def render_report(report):
+    """Render and store one report's PDF; False when it was already up to date"""
+    context = report_context(report)
+    digest = content_hash(context)
+    if not needs_render(report, digest):
+        return False
+    store_pdf(report, html_to_pdf(render_html(context)), digest)
+    logger.info(f"📄 Rendered PDF for report {report.id}")
+    return True
@@ -0,0 +1,152 @@
+# reports/progress.py
+"""
+Per-patient daily progress, maintained incrementally.
+
+Each completed analysis is folded into the patient's row for that day with
+one UPDATE of F() expressions over running sums and a count, so averages
+never need a pass over the patient's history and concurrent workers can't
+lose each other's increments. The first analysis of a day inserts the row.
+rebuild() recomputes rows from the current analyses, for history completed
+before this was in place (see the rebuild_progress command).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, FloatField, IntegerField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, TruncDate
+from django.utils import timezone
+
+from diagnosis.models import AudioRecording
+from .models import ProgressTracking
+
+
+def _update(patient_id, day, added, mismatch, ctc_loss, frequency, seconds):
+    """Apply deltas to an existing row in one UPDATE; False if there is no row yet"""
+    count = Greatest(F('analysis_count') + added, Value(1))
+    avg_mismatch = (F('mismatch_percentage_sum') + mismatch) / count
+    return bool(ProgressTracking.objects.filter(patient_id=patient_id, recorded_date=day).update(
+        analysis_count=F('analysis_count') + added,
+        mismatch_percentage_sum=F('mismatch_percentage_sum') + mismatch,
+        ctc_loss_sum=F('ctc_loss_sum') + ctc_loss,
+        stutter_frequency_sum=F('stutter_frequency_sum') + frequency,
+        practice_seconds=F('practice_seconds') + seconds,
+        avg_mismatch_percentage=avg_mismatch,
+        avg_ctc_loss=(F('ctc_loss_sum') + ctc_loss) / count,
+        avg_stutter_frequency=(F('stutter_frequency_sum') + frequency) / count,
+        total_practice_minutes=Cast((F('practice_seconds') + seconds) / 60, IntegerField()),
+        improvement_score=Coalesce(F('baseline_mismatch_percentage') - avg_mismatch, Value(0.0), output_field=FloatField()),
+    ))
+
+
+def _create(patient_id, day, analysis, seconds):
+    baseline = (
+        ProgressTracking.objects
+        .filter(patient_id=patient_id, recorded_date__lt=day)
+        .order_by('-recorded_date')
+        .values_list('avg_mismatch_percentage', flat=True)
+        .first()
+    )
+    ProgressTracking.objects.create(
+        patient_id=patient_id,
+        recorded_date=day,
+        analysis_count=1,
+        mismatch_percentage_sum=analysis.mismatch_percentage,
+        ctc_loss_sum=analysis.ctc_loss_score,
+        stutter_frequency_sum=analysis.stutter_frequency,
+        practice_seconds=seconds,
+        avg_mismatch_percentage=analysis.mismatch_percentage,
+        avg_ctc_loss=analysis.ctc_loss_score,
+        avg_stutter_frequency=analysis.stutter_frequency,
+        total_practice_minutes=int(seconds // 60),
+        baseline_mismatch_percentage=baseline,
+        improvement_score=baseline - analysis.mismatch_percentage if baseline is not None else 0.0,
+    )
+
+
+def record_analysis(recording, analysis, previous=None):
+    """
+    Fold a recording's new current analysis into its day's progress row.
+    `previous` is the analysis it replaces (re-analysis): its metrics are
+    taken back out and the count stays the same. Call this inside the
+    transaction that makes `analysis` current, so it is counted exactly once.
+    """
+    day = timezone.localdate(recording.recorded_at)
+    if previous is not None and _update(
+        recording.patient_id, day, 0,
+        analysis.mismatch_percentage - previous.mismatch_percentage,
+        analysis.ctc_loss_score - previous.ctc_loss_score,
+        analysis.stutter_frequency - previous.stutter_frequency,
+        0,
+    ):
+        return
+
+    seconds = recording.duration_seconds or 0.0
+    deltas = (analysis.mismatch_percentage, analysis.ctc_loss_score, analysis.stutter_frequency, seconds)
+    if _update(recording.patient_id, day, 1, *deltas):
+        return
+    try:
+        with transaction.atomic():
+            _create(recording.patient_id, day, analysis, seconds)
+    except IntegrityError:
+        # Another worker inserted the day's row first
+        _update(recording.patient_id, day, 1, *deltas)
+
+
+def rebuild(patient_ids):
+    """
+    Recompute these patients' day rows from their current analyses with one
+    grouped query. Existing rows are updated in place so therapist notes
+    survive; rows left without analyses are removed unless they have notes.
+    Returns the number of day rows written.
+    """
+    days = (
+        AudioRecording.objects
+        .filter(patient_id__in=patient_ids, status='completed', analysis__isnull=False)
+        .annotate(day=TruncDate('recorded_at'))
+        .values('patient_id', 'day')
+        .annotate(
+            count=Count('id'),
+            mismatch=Sum('analysis__mismatch_percentage'),
+            ctc_loss=Sum('analysis__ctc_loss_score'),
+            frequency=Sum('analysis__stutter_frequency'),
+            seconds=Coalesce(Sum('duration_seconds'), Value(0.0)),
+        )
+        .order_by('patient_id', 'day')
+    )
+
+    with transaction.atomic():
+        existing = {
+            (row.patient_id, row.recorded_date): row
+            for row in ProgressTracking.objects.select_for_update().filter(patient_id__in=patient_ids)
+        }
+        rows = []
+        baseline = None
+        patient_id = None
+        for day in days:
+            if day['patient_id'] != patient_id:
+                patient_id, baseline = day['patient_id'], None
+            row = existing.pop((patient_id, day['day']), None) or ProgressTracking(
+                patient_id=patient_id, recorded_date=day['day'],
+            )
+            average = day['mismatch'] / day['count']
+            row.analysis_count = day['count']
+            row.mismatch_percentage_sum = day['mismatch']
+            row.ctc_loss_sum = day['ctc_loss']
+            row.stutter_frequency_sum = day['frequency']
+            row.practice_seconds = day['seconds']
+            row.avg_mismatch_percentage = average
+            row.avg_ctc_loss = day['ctc_loss'] / day['count']
+            row.avg_stutter_frequency = day['frequency'] / day['count']
+            row.total_practice_minutes = int(day['seconds'] // 60)
+            row.baseline_mismatch_percentage = baseline
+            row.improvement_score = baseline - average if baseline is not None else 0.0
+            rows.append(row)
+            baseline = average
+
+        fields = [
+            'analysis_count', 'mismatch_percentage_sum', 'ctc_loss_sum', 'stutter_frequency_sum',
+            'practice_seconds', 'avg_mismatch_percentage', 'avg_ctc_loss', 'avg_stutter_frequency',
+            'total_practice_minutes', 'baseline_mismatch_percentage', 'improvement_score',
+        ]
+        ProgressTracking.objects.bulk_update([row for row in rows if row.pk], fields)
+        ProgressTracking.objects.bulk_create([row for row in rows if not row.pk])
+        ProgressTracking.objects.filter(pk__in=[row.pk for row in existing.values() if not row.notes]).delete()
+    return len(rows)
@@ -0,0 +1,99 @@
+# reports/tasks.py
+from celery import group, shared_task
+from django.conf import settings
+from django.utils import timezone
+from datetime import timedelta
+from django.utils.dateparse import parse_datetime
+import logging
+import time
+
+from diagnosis.models import AudioRecording
+from diagnosis.queues import PRIORITY_BATCH
+from .engine import generate_reports, period_bounds
+from .models import Report
+from .pdf import render_report
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_session_report(recording_id):
+    """
+    Session report for one completed recording, queued by the pipeline's
+    aggregate stage; skipped if its current analysis already has one, so a
+    retried stage doesn't duplicate it.
+    """
+    recording = AudioRecording.objects.filter(id=recording_id, status='completed').first()
+    if recording is None:
+        return 0
+    if Report.objects.filter(report_type='session', analyses=recording.analysis_id).exists():
+        return 0
+    start = recording.recorded_at
+    reports = generate_reports([recording.patient_id], 'session', start, start + timedelta(microseconds=1))
+    render_report_pdfs([report.id for report in reports])
+    return len(reports)
+
+
+@shared_task
+def generate_patient_reports(patient_ids, report_type, period_end):
+    """One chunk of the periodic run: weekly/monthly reports for these patients"""
+    started = time.monotonic()
+    start, end = period_bounds(report_type, parse_datetime(period_end))
+    reports = generate_reports(patient_ids, report_type, start, end)
+    logger.info(f"📊 Generated {len(reports)} {report_type} reports for {len(patient_ids)} patients in {time.monotonic() - started:.1f}s")
+    render_report_pdfs([report.id for report in reports])
+    return len(reports)
+
+
+@shared_task
+def schedule_periodic_reports(report_type, batch_size=None):
+    """
+    Periodic: fan weekly/monthly report generation out to the batch queue in
+    chunks of REPORT_BATCH_SIZE patients. Only patients with completed
+    recordings in the period are included, and patients that already got
+    this report type today are skipped, so a rerun doesn't duplicate.
+    """
+    batch_size = batch_size or settings.REPORT_BATCH_SIZE
+    start, end = period_bounds(report_type)
+    active = (
+        AudioRecording.objects
+        .filter(status='completed', recorded_at__gte=start, recorded_at__lt=end)
+        .values_list('patient_id', flat=True)
+        .distinct()
+        .order_by('patient_id')
+    )
+
+    chunks = 0
+    last_id = 0
+    while True:
+        patient_ids = list(active.filter(patient_id__gt=last_id)[:batch_size])
+        if not patient_ids:
+            break
+        last_id = patient_ids[-1]
+        done = set(
+            Report.objects
+            .filter(patient_id__in=patient_ids, report_type=report_type, generated_at__date=timezone.localdate())
+            .values_list('patient_id', flat=True)
+        )
+        pending = [pk for pk in patient_ids if pk not in done]
+        if pending:
+            generate_patient_reports.apply_async(args=[pending, report_type, end.isoformat()], priority=PRIORITY_BATCH)
+            chunks += 1
+
+    logger.info(f"📊 Queued {chunks} chunks of {report_type} reports")
+    return chunks
+
+
+@shared_task
+def render_report_pdf(report_id):
+    """Render one report's PDF unless its inputs are unchanged since the last render"""
+    report = Report.objects.select_related('patient__user').filter(id=report_id).first()
+    if report is None:
+        return False
+    return render_report(report)
+
+
+def render_report_pdfs(report_ids):
+    """Queue PDF rendering; the batch workers' process pool renders them in parallel"""
+    if report_ids:
+        group(render_report_pdf.s(report_id).set(priority=PRIORITY_BATCH) for report_id in report_ids).delay()
@@ -1,6 +1,10 @@
+# reports/urls.py
 from django.urls import path
+from . import views
+
+app_name = 'reports'
 
-# Reports URLs - To be implemented later
 urlpatterns = [
-    # URL patterns will be added when reports feature is implemented
+    path('<int:report_id>/pdf/', views.report_pdf, name='report_pdf'),
+    path('export/', views.export_data, name='export'),
 ]
@@ -0,0 +1,82 @@
+# reports/views.py
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from core.models import Patient
+from .export import FORMATS, MissingDependency, stream_export
+from .models import Report
+from .tasks import render_report_pdf
+
+
+@login_required
+def report_pdf(request, report_id):
+    """
+    Download a report's pre-rendered PDF. Patients see their own reports,
+    staff (therapists) see all. If the PDF isn't ready yet, rendering is
+    queued and the client is told to come back.
+    """
+    reports = Report.objects.all()
+    if not request.user.is_staff:
+        reports = reports.filter(patient__user=request.user)
+    report = get_object_or_404(reports, id=report_id)
+
+    pdf = None
+    if report.pdf_file:
+        try:
+            pdf = report.pdf_file.open('rb')
+        except FileNotFoundError:
+            pass
+    if pdf is None:
+        render_report_pdf.delay(report.id)
+        return JsonResponse({'status': 'rendering', 'report_id': report.id}, status=202)
+
+    response = FileResponse(pdf, as_attachment=True, filename=f'report-{report.id}.pdf', content_type='application/pdf')
+    response['Cache-Control'] = 'private, max-age=3600'
+    return response
+
+
+EXPORT_CONTENT_TYPES = {'csv': 'text/csv', 'parquet': 'application/vnd.apache.parquet'}
+
+
+@login_required
+def export_data(request):
+    """
+    Stream analyses or daily progress as CSV or Parquet. Staff can export any
+    cohort (?patient=1&patient=2, default everyone); patients get their own data.
+    Optional filters: since/until (YYYY-MM-DD), all_versions=1 for every model version.
+    """
+    dataset = request.GET.get('dataset', 'analyses')
+    export_format = request.GET.get('format', 'csv')
+    if dataset not in ('analyses', 'progress'):
+        return JsonResponse({'error': 'dataset must be analyses or progress'}, status=400)
+    if export_format not in FORMATS:
+        return JsonResponse({'error': f"format must be one of {', '.join(FORMATS)}"}, status=400)
+
+    try:
+        since = parse_date(request.GET['since']) if request.GET.get('since') else None
+        until = parse_date(request.GET['until']) if request.GET.get('until') else None
+        patient_ids = [int(pk) for pk in request.GET.getlist('patient')]
+    except ValueError:
+        return JsonResponse({'error': 'Invalid patient id or date'}, status=400)
+
+    if not request.user.is_staff:
+        try:
+            patient_ids = [request.user.patient_profile.id]
+        except Patient.DoesNotExist:
+            return JsonResponse({'error': 'Patient profile not found'}, status=404)
+
+    try:
+        chunks = stream_export(
+            dataset, export_format, patient_ids=patient_ids, since=since, until=until,
+            all_versions=request.GET.get('all_versions') == '1',
+        )
+    except MissingDependency as e:
+        return JsonResponse({'error': str(e)}, status=501)
+
+    response = StreamingHttpResponse(chunks, content_type=EXPORT_CONTENT_TYPES[export_format])
+    filename = f'slaq-{dataset}-{timezone.localdate():%Y%m%d}.{export_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -1,7 +1,9 @@
 # slaq_project/settings.py
 import os
+import tempfile
 from pathlib import Path
 from datetime import timedelta
+from celery.schedules import crontab
 
 from environ import Env
 import dj_database_url
@@ -29,6 +31,21 @@ SUPABASE_ANON_KEY = env.str('SUPABASE_ANON_KEY')
 SUPABASE_SERVICE_ROLE_KEY = env.str('SUPABASE_SERVICE_ROLE_KEY')
 SUPABASE_BUCKET_NAME = env.str('SUPABASE_BUCKET_NAME')
 
+# Files larger than one chunk go through Supabase's resumable (TUS) endpoint,
+# which expects 6MB chunks
+SUPABASE_UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024
+SUPABASE_UPLOAD_MAX_RETRIES = 5
+
+# exists()/size() metadata lookups are cached briefly; misses expire sooner
+SUPABASE_METADATA_CACHE_TTL = 60
+SUPABASE_METADATA_NEGATIVE_TTL = 10
+# Paths per storage remove() call when deleting in bulk (Supabase accepts up to 1000)
+STORAGE_DELETE_BATCH_SIZE = 500
+
+# Local read-through disk cache for objects downloaded from Supabase (0 disables it)
+STORAGE_CACHE_DIR = env('STORAGE_CACHE_DIR', default=os.path.join(tempfile.gettempdir(), 'slaq-storage-cache'))
+STORAGE_CACHE_MAX_BYTES = env.int('STORAGE_CACHE_MAX_BYTES', default=2 * 1024 * 1024 * 1024)  # 2GB
+
 # Application definition
 INSTALLED_APPS = [
     'django.contrib.admin',
@@ -47,6 +64,7 @@ INSTALLED_APPS = [
     # Local apps
     'core.apps.CoreConfig',
     'diagnosis.apps.DiagnosisConfig',
+    'reports.apps.ReportsConfig',
 ]
 
 MIDDLEWARE = [
@@ -141,14 +159,146 @@ LOGOUT_REDIRECT_URL = '/'
 MAX_UPLOAD_SIZE = 10 * 1024 * 1024  # 10MB
 ALLOWED_AUDIO_FORMATS = ['.wav', '.mp3', '.webm', '.ogg']
 
+# Direct-to-storage uploads: how long a signed upload URL / finalize ticket stays valid
+DIRECT_UPLOAD_URL_EXPIRES_IN = 60 * 10  # 10 minutes
+
+# Per-patient upload token bucket (Redis); over the limit returns 429 + Retry-After
+UPLOAD_RATE_LIMIT_PER_HOUR = env.int('UPLOAD_RATE_LIMIT_PER_HOUR', default=30)
+UPLOAD_RATE_LIMIT_BURST = env.int('UPLOAD_RATE_LIMIT_BURST', default=5)
+
 # Celery Configuration
 CELERY_BROKER_URL = env('CELERY_BROKER_URL')
-CELERY_RESULT_BACKEND = 'django-db'
+# Results: nothing reads task results back (status is polled from the DB and
+# pipeline stages hand data along the chain), so they are ignored by default
+# and, for tasks that opt in, kept in Redis with a TTL. Set
+# CELERY_RESULT_BACKEND=django-db to keep the old table (purged after
+# CELERY_RESULT_EXPIRES by beat's backend_cleanup).
+CELERY_RESULT_BACKEND = env('CELERY_RESULT_BACKEND', default=CELERY_BROKER_URL)
+CELERY_TASK_IGNORE_RESULT = env.bool('CELERY_TASK_IGNORE_RESULT', default=True)
+CELERY_RESULT_EXPIRES = timedelta(hours=env.int('CELERY_RESULT_TTL_HOURS', default=24))
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Task routing: interactive uploads, long recordings and batch/backfill work
+# each get a queue (and a dedicated worker pool, see README) so bulk jobs never
+# sit in front of a patient waiting on the record page
+CELERY_TASK_DEFAULT_QUEUE = 'interactive'
+CELERY_TASK_ROUTES = {
+    # Analysis pipeline stages; inference goes to interactive/long/batch per recording
+    'diagnosis.tasks.fetch_recording_audio': {'queue': 'io'},
+    'diagnosis.tasks.preprocess_recording_audio': {'queue': 'cpu'},
+    'diagnosis.tasks.persist_recording_analysis': {'queue': 'db'},
+    'diagnosis.tasks.aggregate_recording_analysis': {'queue': 'db'},
+    # Housekeeping and fan-out run beside the DB stages, never in front of inference
+    'diagnosis.tasks.process_audio_recording': {'queue': 'db'},
+    'diagnosis.tasks.dispatch_pending_analyses': {'queue': 'db'},
+    'diagnosis.tasks.reap_stuck_analyses': {'queue': 'db'},
+    'diagnosis.tasks.generate_recording_visuals': {'queue': 'batch'},
+    'diagnosis.tasks.archive_recording_audio': {'queue': 'batch'},
+    'diagnosis.tasks.purge_expired_originals': {'queue': 'batch'},
+    'diagnosis.tasks.purge_expired_recordings': {'queue': 'batch'},
+    'diagnosis.tasks.reanalyze_recordings': {'queue': 'batch'},
+    'reports.tasks.*': {'queue': 'batch'},
+}
+# Redis emulates priorities with one list per step; lower values are served first
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+}
+CELERY_TASK_DEFAULT_PRIORITY = 5
+# Reserve one task per worker process so a long job can't hold queued work hostage
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+# Scratch space for pipeline stages (downloaded audio, resampled WAV, API
+# response); must be a shared volume when stage pools run on different hosts
+ANALYSIS_WORK_DIR = env('ANALYSIS_WORK_DIR', default=os.path.join(tempfile.gettempdir(), 'slaq-analysis'))
+# Uploads larger than this are analysed on the 'long' queue
+ANALYSIS_LONG_RECORDING_BYTES = env.int('ANALYSIS_LONG_RECORDING_BYTES', default=4 * 1024 * 1024)  # 4MB
+# Fair share: analyses queued per patient at once; the rest wait for the
+# dispatcher, which round-robins them across patients as slots free up
+ANALYSIS_MAX_INFLIGHT_PER_PATIENT = env.int('ANALYSIS_MAX_INFLIGHT_PER_PATIENT', default=2)
+ANALYSIS_DISPATCH_BATCH_SIZE = 100  # recordings queued per dispatcher run
+# Backpressure: past this many queued analyses, uploads are told to expect a
+# wait (202 + ETA) and batch/backfill work is deferred
+ANALYSIS_BACKPRESSURE_DEPTH = env.int('ANALYSIS_BACKPRESSURE_DEPTH', default=50)
+ANALYSIS_BATCH_DEFER_SECONDS = 300
+# Bearer token for /metrics/ (autoscaler, Prometheus); empty = staff sessions only
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+# Single-flight lease per recording; longer than the slowest analysis
+ANALYSIS_LEASE_SECONDS = 15 * 60
+# Transient failures (timeouts, connection errors, 5xx/429) retry with capped
+# exponential backoff plus jitter; anything else fails fast to the dead-letter table
+ANALYSIS_MAX_RETRIES = 5
+ANALYSIS_RETRY_BASE_SECONDS = 30
+ANALYSIS_RETRY_MAX_SECONDS = 15 * 60
+# Stuck-job reaper: in-flight analyses silent for this long are requeued, and
+# failed once they have been requeued ANALYSIS_MAX_REAPS times
+ANALYSIS_STALE_PROCESSING_SECONDS = 30 * 60  # longer than the lease and the retry cap
+ANALYSIS_STALE_QUEUED_SECONDS = 2 * 60 * 60  # queued but never started (lost message)
+ANALYSIS_MAX_REAPS = 2
+ANALYSIS_REAP_BATCH_SIZE = 500
+# Pipeline stages only rewrite the heartbeat once it is this old; well under the stale cutoff
+ANALYSIS_HEARTBEAT_SECONDS = 5 * 60
+
+# Periodic tasks (run `celery -A slaq_project beat`)
+CELERY_BEAT_SCHEDULE = {
+    'purge-expired-original-audio': {
+        'task': 'diagnosis.tasks.purge_expired_originals',
+        'schedule': timedelta(hours=6),
+    },
+    'purge-expired-recordings': {
+        'task': 'diagnosis.tasks.purge_expired_recordings',
+        'schedule': timedelta(days=1),
+    },
+    'dispatch-pending-analyses': {
+        'task': 'diagnosis.tasks.dispatch_pending_analyses',
+        'schedule': timedelta(seconds=30),
+    },
+    'reap-stuck-analyses': {
+        'task': 'diagnosis.tasks.reap_stuck_analyses',
+        'schedule': timedelta(minutes=5),
+    },
+    'weekly-reports': {
+        'task': 'reports.tasks.schedule_periodic_reports',
+        'schedule': crontab(hour=2, minute=0, day_of_week='monday'),
+        'args': ('weekly',),
+    },
+    'monthly-reports': {
+        'task': 'reports.tasks.schedule_periodic_reports',
+        'schedule': crontab(hour=3, minute=0, day_of_month='1'),
+        'args': ('monthly',),
+    },
+}
+
+# Reports: patients per generation task in the periodic fan-out
+REPORT_BATCH_SIZE = env.int('REPORT_BATCH_SIZE', default=500)
+# Rows fetched per server-side cursor round trip (and per CSV chunk / Parquet row group) in exports
+EXPORT_CHUNK_SIZE = env.int('EXPORT_CHUNK_SIZE', default=2000)
+
+# Cache Configuration
+# Redis in production (shared by web nodes), per-process memory cache otherwise
+REDIS_URL = env('REDIS_URL', default=CELERY_BROKER_URL)
+if ENVIRONMENT == 'production':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'slaq',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Completed analyses never change, so their rendered output can live for a long time
+ANALYSIS_PAGE_CACHE_TIMEOUT = 60 * 60 * 24 * 7  # 7 days
+ANALYSIS_PAGE_MAX_AGE = 60 * 5  # browser freshness before revalidating
+
 # AI Model Configuration
 AI_MODELS_DIR = BASE_DIR / 'ml_models'
 WAV2VEC2_BASE_MODEL = "facebook/wav2vec2-base-960h"
@@ -156,6 +306,22 @@ WAV2VEC2_BASE_MODEL = "facebook/wav2vec2-base-960h"
 # Audio Processing Settings
 AUDIO_SAMPLE_RATE = 16000
 
+# Archival transcoding after analysis: 'opus' (lossy, Ogg container) or 'flac' (lossless)
+AUDIO_ARCHIVE_ENABLED = env.bool('AUDIO_ARCHIVE_ENABLED', default=True)
+AUDIO_ARCHIVE_FORMAT = env('AUDIO_ARCHIVE_FORMAT', default='opus')
+AUDIO_ARCHIVE_BITRATE_KBPS = env.int('AUDIO_ARCHIVE_BITRATE_KBPS', default=32)  # opus only
+AUDIO_ORIGINAL_RETENTION_DAYS = env.int('AUDIO_ORIGINAL_RETENTION_DAYS', default=30)  # 0 = drop immediately
+# An archive only replaces the original if it stays this close to it
+AUDIO_ARCHIVE_MIN_SIMILARITY = 0.98  # log-mel spectrogram correlation
+AUDIO_ARCHIVE_MAX_DURATION_DRIFT = 0.1  # seconds
+# Fraction of archives re-analysed end to end, and how far mismatch % may move
+AUDIO_ARCHIVE_VERIFY_SAMPLE_RATE = 0.05
+AUDIO_ARCHIVE_MISMATCH_TOLERANCE = 5.0  # percentage points
+
+# Retention: recordings (audio, visuals and analysis) older than this are purged
+RECORDING_RETENTION_DAYS = env.int('RECORDING_RETENTION_DAYS', default=0)  # 0 = keep forever
+RECORDING_PURGE_BATCH_SIZE = 1000  # rows deleted per transaction
+
 # Stutter Detection Thresholds
 STUTTER_THRESHOLDS = {
     'prolongation_duration': 0.4,  # seconds
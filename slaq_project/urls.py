@@ -7,6 +7,7 @@ urlpatterns = [
     path('theboss/', admin.site.urls),
     path('', include('core.urls')),                  # Auth & dashboard
     path('diagnosis/', include('diagnosis.urls')),   # Audio & analysis
+    path('reports/', include('reports.urls')),       # Progress reports
 ]
 
 # Serve media files in development (static is served by WhiteNoise)
@@ -278,3 +278,50 @@ function initEventTypesChart(eventTypes) {
         }
     });
 }
+
+// Stutter timeline drawn from precomputed waveform peaks (no audio download)
+function initStutterTimeline() {
+    const canvas = document.getElementById('stutter-timeline');
+    const dataElement = document.getElementById('stutter-timeline-data');
+    if (!canvas || !dataElement) {
+        return;
+    }
+    
+    const timeline = JSON.parse(dataElement.textContent);
+    const peaks = timeline.peaks;
+    const duration = peaks.duration || 1;
+    
+    // Pick the smallest resolution that still covers every pixel
+    const resolutions = Object.keys(peaks.resolutions).map(Number).sort((a, b) => a - b);
+    const resolution = resolutions.find(r => r >= canvas.width) || resolutions[resolutions.length - 1];
+    const binary = atob(peaks.resolutions[String(resolution)]);
+    const values = new Int8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        values[i] = binary.charCodeAt(i) << 24 >> 24;
+    }
+    
+    const ctx = canvas.getContext('2d');
+    const width = canvas.width;
+    const height = canvas.height;
+    const middle = height / 2;
+    ctx.clearRect(0, 0, width, height);
+    
+    // Stutter spans behind the waveform
+    ctx.fillStyle = 'rgba(239, 68, 68, 0.35)';
+    (timeline.stutter_timestamps || []).forEach(span => {
+        const start = Array.isArray(span) ? span[0] : span.start;
+        const end = Array.isArray(span) ? span[1] : span.end;
+        const x = (start / duration) * width;
+        ctx.fillRect(x, 0, Math.max(1, ((end - start) / duration) * width), height);
+    });
+    
+    // Waveform: one min/max pair per bucket
+    const buckets = values.length / 2;
+    ctx.fillStyle = 'rgba(0, 144, 80, 0.8)';
+    for (let i = 0; i < buckets; i++) {
+        const x = (i / buckets) * width;
+        const top = middle - (values[i * 2 + 1] / 127) * middle;
+        const bottom = middle - (values[i * 2] / 127) * middle;
+        ctx.fillRect(x, top, Math.max(1, width / buckets), Math.max(1, bottom - top));
+    }
+}
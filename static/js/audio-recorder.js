@@ -135,9 +135,7 @@ async function uploadRecording() {
         return;
     }
     
-    const formData = new FormData();
     const filename = `recording_${Date.now()}.webm`;
-    formData.append('audio_file', recordedBlob, filename);
     
     // Get CSRF token
     const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
@@ -147,20 +145,12 @@ async function uploadRecording() {
         document.getElementById('upload-progress').classList.remove('hidden');
         document.getElementById('upload-recording-btn').disabled = true;
         
-        const response = await fetch('/diagnosis/upload/', {
-            method: 'POST',
-            body: formData,
-            headers: {
-                'X-CSRFToken': csrfToken
-            }
-        });
-        
-        const data = await response.json();
+        const { response, data } = await uploadAudioDirect(recordedBlob, filename, csrfToken);
         
         if (response.ok && data.success) {
             // Update progress to 100%
             document.getElementById('upload-progress-bar').style.width = '100%';
-            document.getElementById('upload-status-text').textContent = 'Upload complete! Processing...';
+            document.getElementById('upload-status-text').textContent = uploadStatusText(data);
             
             // Start polling for status
             pollRecordingStatus(data.recording_id);
@@ -177,6 +167,72 @@ async function uploadRecording() {
     }
 }
 
+// Direct-to-storage upload: sign -> PUT to storage -> finalize
+async function uploadAudioDirect(blob, filename, csrfToken) {
+    const sha256 = await hashAudioBlob(blob);
+    const signResponse = await fetch('/diagnosis/upload/sign/', {
+        method: 'POST',
+        body: JSON.stringify({
+            filename: filename,
+            size: blob.size,
+            content_type: blob.type,
+            sha256: sha256
+        }),
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrfToken
+        }
+    });
+    const signData = await signResponse.json();
+    if (!signResponse.ok) {
+        return { response: signResponse, data: signData };
+    }
+    
+    // Content already stored for this patient: skip the transfer entirely
+    if (!signData.duplicate) {
+        const upload = signData.upload;
+        const putResponse = await fetch(upload.url, {
+            method: upload.method,
+            body: blob,
+            headers: Object.assign({ 'Content-Type': blob.type || 'application/octet-stream' }, upload.headers)
+        });
+        if (!putResponse.ok) {
+            throw new Error(`Storage upload failed (${putResponse.status})`);
+        }
+    }
+    document.getElementById('upload-progress-bar').style.width = '90%';
+    
+    const finalizeResponse = await fetch('/diagnosis/upload/finalize/', {
+        method: 'POST',
+        body: JSON.stringify({ ticket: signData.ticket }),
+        headers: {
+            'Content-Type': 'application/json',
+            'X-CSRFToken': csrfToken
+        }
+    });
+    return { response: finalizeResponse, data: await finalizeResponse.json() };
+}
+
+// Status line after upload, with the server's queued-ETA estimate when busy
+function uploadStatusText(data) {
+    const eta = data.queue && data.queue.eta_seconds;
+    if (eta && eta >= 60) {
+        return `Upload complete! Queued, analysis starts in about ${Math.round(eta / 60)} min...`;
+    }
+    return 'Upload complete! Processing...';
+}
+
+// SHA-256 of the audio, or null where WebCrypto is unavailable (non-HTTPS origins)
+async function hashAudioBlob(blob) {
+    if (!window.crypto || !window.crypto.subtle) {
+        return null;
+    }
+    const digest = await window.crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+    return Array.from(new Uint8Array(digest))
+        .map(b => b.toString(16).padStart(2, '0'))
+        .join('');
+}
+
 // Poll Recording Status
 function pollRecordingStatus(recordingId) {
     const pollInterval = setInterval(async () => {
@@ -367,26 +423,17 @@ function initFileUpload() {
                 return;
             }
             
-            const formData = new FormData(form);
             const csrfToken = document.querySelector('[name=csrfmiddlewaretoken]').value;
             
             try {
                 document.getElementById('upload-progress').classList.remove('hidden');
                 form.querySelector('button[type=submit]').disabled = true;
                 
-                const response = await fetch('/diagnosis/upload/', {
-                    method: 'POST',
-                    body: formData,
-                    headers: {
-                        'X-CSRFToken': csrfToken
-                    }
-                });
-                
-                const data = await response.json();
+                const { response, data } = await uploadAudioDirect(file, file.name, csrfToken);
                 
                 if (response.ok && data.success) {
                     document.getElementById('upload-progress-bar').style.width = '100%';
-                    document.getElementById('upload-status-text').textContent = 'Upload complete! Processing...';
+                    document.getElementById('upload-status-text').textContent = uploadStatusText(data);
                     pollRecordingStatus(data.recording_id);
                 } else {
                     throw new Error(data.error || 'Upload failed');